@@ -0,0 +1,133 @@
+"""Sweeps the complexity threshold of adaptive tiled inference.
+
+    python adaptive.py --weights checkpoint/weights_adversarial25 \
+        --predict-dir samples/ --thresholds 0,5,10,20,40,80 --out adaptive.json
+
+Each input is downscaled the way --predict-only does it. It is upscaled
+once with the generator on every tile, then once per threshold with flat
+tiles routed to bicubic (inference.tiled_upscale). For each threshold the
+report gives the share of generator tiles skipped, the wall-clock speedup
+and the PSNR/SSIM lost against the all-generator result. Plain bicubic is
+reported as the lower bound.
+"""
+import argparse
+import collections
+import glob
+import json
+import logging
+import time
+
+import numpy as np
+import tensorflow as tf
+from scipy.misc import imresize
+
+import config as cfg
+from inference import load_upscaler, tiled_upscale
+from metrics import Scores, evaluate_batch
+from stream import list_inputs, load_image
+
+
+def sample_inputs(num_images):
+    """The first `num_images` of --predict-dir / --predict-list, or a seeded
+    sample of IMAGES."""
+    paths = list_inputs(cfg.PREDICT_DIR, cfg.PREDICT_LIST)
+    if not paths:
+        paths = sorted(glob.glob(cfg.IMAGES))
+        np.random.RandomState(cfg.RANDOM_SEED).shuffle(paths)
+    return paths[:num_images]
+
+
+def run(upscaler, images, threshold):
+    """Upscales every (hr, lr) pair with `threshold` (None: generator on
+    every tile) and returns the scores, seconds and tile counts."""
+    scores = Scores()
+    stats = collections.Counter()
+    elapsed = 0.
+    for hr, lr in images:
+        start = time.time()
+        sr = tiled_upscale(upscaler.run, lr, threshold=threshold, stats=stats)
+        elapsed += time.time() - start
+        sr = np.maximum(np.minimum(sr, 255.0), 0.0)
+        scores.add(evaluate_batch(sr[None], hr[None]))
+    return scores, elapsed, stats
+
+
+def sweep(upscaler, images, thresholds):
+    full, full_time, _ = run(upscaler, images, None)
+    bicubic = Scores()
+    for hr, lr in images:
+        bicubic.add(evaluate_batch(imresize(lr, cfg.r * 100, interp='bicubic')[None], hr[None]))
+    logging.info("generator: PSNR %.3f SSIM %.4f in %.2fs; bicubic: PSNR %.3f SSIM %.4f",
+            full.mean('psnr'), full.mean('ssim'), full_time,
+            bicubic.mean('psnr'), bicubic.mean('ssim'))
+    results = []
+    for threshold in thresholds:
+        scores, elapsed, stats = run(upscaler, images, threshold)
+        res = {
+            "threshold": threshold,
+            "generator_tiles": stats['generator_tiles'],
+            "tiles": stats['tiles'],
+            "compute_saved": 1. - stats['generator_tiles'] / float(max(stats['tiles'], 1)),
+            "speedup": full_time / elapsed,
+            "psnr": scores.mean('psnr'),
+            "ssim": scores.mean('ssim'),
+            "psnr_cost": full.mean('psnr') - scores.mean('psnr'),
+            "ssim_cost": full.mean('ssim') - scores.mean('ssim'),
+        }
+        logging.info("threshold %8.2f: %5.1f%% tiles on bicubic, %.2fx faster, "
+                "PSNR -%.3f, SSIM -%.4f", threshold, 100 * res["compute_saved"],
+                res["speedup"], res["psnr_cost"], res["ssim_cost"])
+        results.append(res)
+    baseline = {
+        "generator": {"psnr": full.mean('psnr'), "ssim": full.mean('ssim'), "seconds": full_time},
+        "bicubic": {"psnr": bicubic.mean('psnr'), "ssim": bicubic.mean('ssim')},
+    }
+    return baseline, results
+
+
+def main(args):
+    config = tf.ConfigProto()
+    config.gpu_options.allow_growth = True
+    sess = tf.Session(config=config)
+    upscaler = load_upscaler(sess)
+    sess.graph.finalize()
+    cfg.STREAM_DOWNSCALE = True
+    images = [load_image(path) for path in sample_inputs(args.images)]
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    baseline, results = sweep(upscaler, images, thresholds)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"images": len(images), "tile": cfg.TILE_SIZE, "overlap": cfg.TILE_OVERLAP,
+                       "baseline": baseline, "results": results}, f, indent=2, sort_keys=True)
+    sess.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str)
+    parser.add_argument('--frozen', type=str)
+    parser.add_argument('--quantized', type=str)
+    parser.add_argument('--predict-dir', type=str)
+    parser.add_argument('--predict-list', type=str)
+    parser.add_argument('--images', type=int, default=32)
+    parser.add_argument('--thresholds', type=str, default="0,5,10,20,40,80,160")
+    parser.add_argument('--tile-size', type=int)
+    parser.add_argument('--tile-overlap', type=int)
+    parser.add_argument('--out', type=str, default="adaptive.json")
+    args = parser.parse_args()
+    if args.weights:
+        cfg.WEIGHTS = args.weights
+    if args.frozen:
+        cfg.FROZEN = args.frozen
+    if args.quantized:
+        cfg.QUANTIZED = args.quantized
+    if args.predict_dir:
+        cfg.PREDICT_DIR = args.predict_dir
+    if args.predict_list:
+        cfg.PREDICT_LIST = args.predict_list
+    if args.tile_size:
+        cfg.TILE_SIZE = args.tile_size
+    if args.tile_overlap is not None:
+        cfg.TILE_OVERLAP = args.tile_overlap
+    main(args)
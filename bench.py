@@ -0,0 +1,221 @@
+"""Benchmarks every stage of the training and inference path on synthetic
+images and writes the results as JSON, e.g.
+
+    python bench.py --batch-sizes 1,8,32 --image-sizes 96,256,512 --out bench.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import config as cfg
+from model import Loader, SuperRes
+
+STAGES = ("decode", "queue", "resize", "generator", "discriminator",
+          "pretrain", "train", "predict")
+# Stages whose cost depends on the generator's upsampler.
+MODEL_STAGES = ("generator", "pretrain", "train", "predict")
+
+
+def synthetic_image(size, seed=0):
+    """Smooth random image so JPEG sizes resemble photos rather than noise."""
+    rng = np.random.RandomState(seed)
+    small = rng.randint(0, 256, (size // 8 + 1, size // 8 + 1, cfg.NUM_CHANNELS)).astype(np.uint8)
+    img = Image.fromarray(small).resize((size, size), Image.BICUBIC)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def jpeg_bytes(img):
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def time_fn(fn, iters, warmup):
+    """Returns the per-call latencies of `fn` in seconds."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(iters):
+        start = time.time()
+        fn()
+        latencies.append(time.time() - start)
+    return np.array(latencies)
+
+
+def summarize(stage, batch_size, image_size, latencies):
+    return {
+        "stage": stage,
+        "batch_size": batch_size,
+        "image_size": image_size,
+        "images_per_sec": batch_size / latencies.mean(),
+        "latency_ms": dict(("p%d" % p, 1000. * np.percentile(latencies, p))
+                for p in (50, 90, 99)),
+    }
+
+
+class SyntheticLoader(object):
+    """Loader stand-in serving a constant batch, so model stages are timed
+    without the input pipeline."""
+    def __init__(self):
+        hr = np.stack([synthetic_image(cfg.HR_HEIGHT, i) for i in range(cfg.BATCH_SIZE)])
+        self.hr = tf.constant(hr)
+        self.lr = tf.image.resize_bicubic(self.hr, [cfg.LR_HEIGHT, cfg.LR_WIDTH])
+        cfg.NUM_TRAIN_BATCHES = cfg.NUM_VAL_BATCHES = cfg.NUM_TEST_BATCHES = 1
+
+    def batch(self):
+        return ((self.lr, self.hr),) * 3
+
+
+def bench_decode(sess, batch_size, image_size, iters, warmup):
+    data = tf.placeholder(tf.string, [])
+    decoded = tf.image.decode_jpeg(data, channels=cfg.NUM_CHANNELS)
+    jpeg = jpeg_bytes(synthetic_image(image_size))
+    def step():
+        for _ in range(batch_size):
+            sess.run(decoded, feed_dict={data: jpeg})
+    return time_fn(step, iters, warmup)
+
+
+def bench_queue(sess, batch_size, image_size, iters, warmup):
+    """Loader pipeline end to end: read, decode, random_crop, shuffle queue
+    and resize_bicubic over synthetic JPEG files in a temp directory, with
+    the current READER_THREADS and CROPS_PER_DECODE."""
+    tmp = tempfile.mkdtemp()
+    try:
+        files = []
+        for i in range(16):
+            path = os.path.join(tmp, "%d.JPEG" % i)
+            Image.fromarray(synthetic_image(image_size, i)).save(path, quality=90)
+            files.append(path)
+        loader = Loader(files, files, files)
+        train_batch = loader.batch()[0]
+        coord = tf.train.Coordinator()
+        threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+        try:
+            return time_fn(lambda: sess.run(train_batch), iters, warmup)
+        finally:
+            coord.request_stop()
+            coord.join(threads, stop_grace_period_secs=5)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_resize(sess, batch_size, image_size, iters, warmup):
+    hr = tf.constant(np.stack([synthetic_image(cfg.HR_HEIGHT, i) for i in range(batch_size)]))
+    lr = tf.image.resize_bicubic(hr, [cfg.LR_HEIGHT, cfg.LR_WIDTH])
+    return time_fn(lambda: sess.run(lr), iters, warmup)
+
+
+def bench_model(sess, stage, batch_size, image_size, iters, warmup):
+    model = SuperRes(sess, SyntheticLoader())
+    model.merged = tf.merge_all_summaries()
+    sess.run(tf.initialize_all_variables())
+    gan = model.GAN
+    if stage == "generator":
+        fn = lambda: sess.run(gan.G, feed_dict=model._feed(model.train_batch, False))
+    elif stage == "discriminator":
+        fn = lambda: sess.run(gan.D, feed_dict=model._feed(model.train_batch, False))
+    elif stage == "pretrain":
+        fn = model._pretrain
+    elif stage == "train":
+        fn = model._train
+    else:
+        lr = synthetic_image(image_size // cfg.r)
+        fn = lambda: [model.upscaler.upscale(lr) for _ in range(batch_size)]
+    return time_fn(fn, iters, warmup)
+
+
+def run_stage(stage, batch_size, image_size, iters, warmup):
+    cfg.BATCH_SIZE = batch_size
+    with tf.Graph().as_default():
+        sess = tf.Session()
+        try:
+            if stage == "decode":
+                return bench_decode(sess, batch_size, image_size, iters, warmup)
+            if stage == "queue":
+                return bench_queue(sess, batch_size, image_size, iters, warmup)
+            if stage == "resize":
+                return bench_resize(sess, batch_size, image_size, iters, warmup)
+            return bench_model(sess, stage, batch_size, image_size, iters, warmup)
+        finally:
+            sess.close()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def main(args):
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    image_sizes = [int(s) for s in args.image_sizes.split(",")]
+    stages = args.stages.split(",") if args.stages else STAGES
+    upsamplers = args.upsamplers.split(",")
+    reader_threads = [int(t) for t in args.reader_threads.split(",")]
+    crops_per_decode = [int(k) for k in args.crops_per_decode.split(",")]
+    results = []
+    for stage in stages:
+        # Model stages train on HR_HEIGHT crops; only decode, queue and
+        # predict depend on the source image size.
+        sizes = image_sizes if stage in ("decode", "queue", "predict") else [cfg.HR_HEIGHT]
+        # Only the queue stage depends on the Loader's reader settings.
+        if stage == "queue":
+            loader_configs = [(t, k) for t in reader_threads for k in crops_per_decode]
+        else:
+            loader_configs = [(cfg.READER_THREADS, cfg.CROPS_PER_DECODE)]
+        for upsampler in (upsamplers if stage in MODEL_STAGES else [cfg.UPSAMPLER]):
+            cfg.UPSAMPLER = upsampler
+            for cfg.READER_THREADS, cfg.CROPS_PER_DECODE in loader_configs:
+                for image_size in sizes:
+                    for batch_size in batch_sizes:
+                        latencies = run_stage(stage, batch_size, image_size, args.iters, args.warmup)
+                        res = summarize(stage, batch_size, image_size, latencies)
+                        res["upsampler"] = upsampler
+                        res["reader_threads"] = cfg.READER_THREADS
+                        res["crops_per_decode"] = cfg.CROPS_PER_DECODE
+                        logging.info("%-13s %-8s threads %2d crops %2d batch %3d size %4d: "
+                                "%8.2f images/sec, p50 %.1f ms, p99 %.1f ms",
+                                stage, upsampler, cfg.READER_THREADS, cfg.CROPS_PER_DECODE,
+                                batch_size, image_size, res["images_per_sec"],
+                                res["latency_ms"]["p50"], res["latency_ms"]["p99"])
+                        results.append(res)
+
+    report = {
+        "revision": git_revision(),
+        "tensorflow": tf.__version__,
+        "iters": args.iters,
+        "warmup": args.warmup,
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    logging.info("Wrote %s", args.out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stages', type=str, help="comma separated subset of " + ",".join(STAGES))
+    parser.add_argument('--batch-sizes', type=str, default="1,8,32")
+    parser.add_argument('--image-sizes', type=str, default="96,256,512")
+    parser.add_argument('--upsamplers', type=str, default="deconv,subpixel")
+    parser.add_argument('--reader-threads', type=str, default="1,2,4",
+            help="Loader reader threads to sweep in the queue stage")
+    parser.add_argument('--crops-per-decode', type=str, default="1,4,16",
+            help="Loader crops per decoded image to sweep in the queue stage")
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--out', type=str, default="bench.json")
+    main(parser.parse_args())
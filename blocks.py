@@ -14,19 +14,20 @@ def relu_block(x, alpha=0., max_value=None):
     x -= tf.constant(alpha, dtype=tf.float32) * negative_part
     return x
 
-def res_block(inp, is_training_cond, reuse=False):
+def res_block(inp, is_training_cond, reuse=False, channels=64):
     """ResNet B Block.
     TODO: decide whether bias is worth it
     """
     inp_shape = inp.get_shape()
-    assert inp_shape[-1] == 64 # Must have 64 channels to start.
+    assert inp_shape[-1] == channels # Must have `channels` channels to start.
 
     with tf.variable_scope("resconv1"):
         h = conv_block(inp, relu=True, bn=True, is_training_cond=is_training_cond,
-                reuse=reuse)
+                output_channels=channels, reuse=reuse)
 
     with tf.variable_scope("resconv2"):
-        h = conv_block(h, bn=True, is_training_cond=is_training_cond, reuse=reuse)
+        h = conv_block(h, bn=True, is_training_cond=is_training_cond,
+                output_channels=channels, reuse=reuse)
 
     return tf.nn.relu(inp + h)
 
@@ -38,12 +39,26 @@ def deconv_block(inp, relu=True, output_channels=64):
     """
     inp_shape = inp.get_shape()
     kernel_shape = (3, 3, output_channels, inp_shape[-1])
-    output_shape = (int(inp_shape[0]), int(inp_shape[1] * 2), int(inp_shape[2] * 2), output_channels)
+    dyn_shape = tf.shape(inp)
+    output_shape = tf.pack([dyn_shape[0], dyn_shape[1] * 2, dyn_shape[2] * 2, output_channels])
     strides = [1, 2, 2, 1]
 
     weights = tf.get_variable('weights', kernel_shape,
         initializer=tf.random_normal_initializer(stddev=0.02))
     h = tf.nn.conv2d_transpose(inp, weights, output_shape, strides)
+    h.set_shape([inp_shape[0], inp_shape[1] * 2, inp_shape[2] * 2, output_channels])
+
+    if relu:
+        h = tf.nn.relu(h)
+
+    return h
+
+def subpixel_block(inp, relu=True, output_channels=64, r=2):
+    """Sub-pixel upsampling: a conv to output_channels * r^2 channels
+    followed by depth_to_space, instead of a transposed conv over inserted
+    zeros."""
+    h = conv_block(inp, output_channels=output_channels * r * r)
+    h = tf.depth_to_space(h, r)
 
     if relu:
         h = tf.nn.relu(h)
@@ -76,7 +91,7 @@ def conv_block(inp, relu=False, leaky_relu=False, bn=False,
 def dense_block(inp, leaky_relu=False, sigmoid=False,
                 output_size=1024):
     inp_size = inp.get_shape()
-    h = tf.reshape(inp, [int(inp_size[0]), -1])
+    h = tf.reshape(inp, [-1, inp_size[1:].num_elements()])
     h_size = h.get_shape()[1]
 
     w = tf.get_variable("w", [h_size, output_size],
@@ -0,0 +1,161 @@
+import contextlib
+import fcntl
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+
+import config as cfg
+
+
+def weights_id(path):
+    """Identifies the weights at `path` (a checkpoint prefix or an exported
+    artifact) by the names, sizes, inodes and nanosecond mtimes of its files,
+    together with the options that change the output. Checkpoints of one
+    architecture all have the same size, and the Saver writes new files, so
+    two saves within a second still get different ids."""
+    h = hashlib.sha256()
+    for f in sorted([path] + glob.glob(path + ".*")):
+        if os.path.isfile(f) and not f.endswith(".meta"):
+            st = os.stat(f)
+            mtime_ns = getattr(st, 'st_mtime_ns', None) or int(st.st_mtime * 1e9)
+            h.update(("%s %d %d %d\n" % (os.path.abspath(f), st.st_size, st.st_ino,
+                    mtime_ns)).encode())
+    options = (cfg.r, cfg.STREAM_DOWNSCALE, cfg.TILE_PREDICT, cfg.TILE_SIZE, cfg.TILE_OVERLAP,
+               cfg.ADAPTIVE_THRESHOLD)
+    h.update(repr(options).encode())
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """Content-addressed on-disk cache of encoded SR outputs.
+
+    Entries live at cache_dir/<key[:2]>/<key>, where the key is the sha256 of
+    the weights id and the input file bytes, so new weights never see old
+    entries. Entries are written to a temp file and renamed into place, so
+    readers in other processes see a whole entry or none. Reads refresh an
+    entry's mtime. The total size is kept in cache_dir/.size, which every
+    put updates under cache_dir/.lock, so all processes sharing the directory
+    see each other's writes; once it passes `max_bytes` the writer deletes
+    the least recently used entries down to 90% of the limit.
+    """
+    def __init__(self, cache_dir, weights, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.weights = weights
+        self.max_bytes = max_bytes or cfg.CACHE_MAX_BYTES
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.lock_path = os.path.join(cache_dir, ".lock")
+        self.size_path = os.path.join(cache_dir, ".size")
+        with self._locked():
+            self.size = self._read_size()
+            self._write_size(self.size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, data):
+        return hashlib.sha256(self.weights.encode() + b"\0" + data).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_size(self):
+        """Shared total size; rescans the entries if the record is missing."""
+        try:
+            with open(self.size_path) as f:
+                return int(f.read())
+        except (IOError, OSError, ValueError):
+            return sum(size for _, size, _ in self._entries())
+
+    def _write_size(self, size):
+        tmp = self.size_path + ".tmp"
+        with open(tmp, 'w') as f:
+            f.write("%d" % size)
+        os.rename(tmp, self.size_path)
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "??", "*")):
+            if path.endswith(".tmp"):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def get(self, key):
+        """Returns the cached bytes for `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted since the read; the data is still good.
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        entry_dir = os.path.dirname(path)
+        if not os.path.isdir(entry_dir):
+            try:
+                os.makedirs(entry_dir)
+            except OSError:
+                pass
+        fd, tmp = tempfile.mkstemp(dir=entry_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        with self._locked():
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.rename(tmp, path)
+            self.size = self._read_size() + len(data) - replaced
+            if self.size > self.max_bytes:
+                self._evict()
+            self._write_size(self.size)
+
+    def evict(self):
+        with self._locked():
+            self._evict()
+            self._write_size(self.size)
+
+    def _evict(self):
+        # Rescans, so the shared record also recovers from outside deletes.
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self.size = sum(size for _, size, _ in entries)
+        target = 0.9 * self.max_bytes
+        for path, size, _ in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.evictions += 1
+
+    def log_stats(self):
+        logging.info("Result cache: %d hits, %d misses (%.1f%% hit rate), %d evictions, %.1f MB",
+                self.hits, self.misses, 100. * self.hits / max(self.hits + self.misses, 1),
+                self.evictions, self.size / 1e6)
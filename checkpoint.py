@@ -0,0 +1,151 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import tensorflow as tf
+
+import config as cfg
+
+
+def state_path(prefix=None):
+    return (prefix or cfg.CHECKPOINT) + "_state.json"
+
+
+def load_state(prefix=None):
+    """Returns the checkpoint state written by AsyncCheckpointer, or None."""
+    path = state_path(prefix)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def latest_checkpoint():
+    """Returns cfg.WEIGHTS if set, else the newest checkpoint recorded in the
+    checkpoint state file or matching cfg.CHECKPOINT, else None."""
+    if cfg.WEIGHTS:
+        return cfg.WEIGHTS
+    state = load_state()
+    if state and state["checkpoints"]:
+        return state["checkpoints"][-1]["path"]
+    ckpt_files = [x for x in glob.glob(cfg.CHECKPOINT + "*")
+            if "meta" not in x and not x.endswith((".json", ".tmp"))]
+    if len(ckpt_files) == 0:
+        return None
+    ckpt_files.sort(key=lambda s: [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', s)])
+    return ckpt_files[-1]
+
+
+def remove_checkpoint(path):
+    for f in [path] + glob.glob(path + ".*"):
+        if os.path.isfile(f):
+            os.remove(f)
+
+
+class AsyncCheckpointer(object):
+    """Writes checkpoints off the training loop.
+
+    save() copies every variable into a shadow copy with a single sess.run and
+    returns; a background thread then writes the shadows under the original
+    variable names, so the files restore with a plain tf.train.Saver. Each
+    checkpoint is recorded in <CHECKPOINT>_state.json with its phase, epoch,
+    batch and step. Only the newest CHECKPOINT_KEEP checkpoints and the one
+    with the lowest validation loss are kept on disk.
+    """
+    def __init__(self, sess, prefix=None, keep=None, var_list=None, metrics=None):
+        self.sess = sess
+        self.metrics = metrics
+        self.prefix = prefix or cfg.CHECKPOINT
+        self.keep = keep or cfg.CHECKPOINT_KEEP
+        var_list = var_list or tf.all_variables()
+        with tf.name_scope("checkpoint"):
+            shadows = [tf.Variable(tf.zeros(var.get_shape(), dtype=var.dtype.base_dtype),
+                    trainable=False, collections=[]) for var in var_list]
+            self.snapshot = tf.group(*[s.assign(v) for s, v in zip(shadows, var_list)])
+        self.saver = tf.train.Saver(dict((v.op.name, s) for v, s in zip(var_list, shadows)),
+                max_to_keep=None)
+        self.state = load_state(self.prefix) or {"checkpoints": []}
+        self.thread = None
+        self.error = None
+        self.last_duration = None
+
+    def save(self, phase, epoch, batch, step, val_loss=None):
+        """Checkpoints the current variables as having finished `batch`
+        batches of `epoch` in `phase`, `step` steps into that phase."""
+        self.wait()
+        start = time.time()
+        self.sess.run(self.snapshot)
+        name = "_adversarial" if phase == "adversarial" else ""
+        path = self.prefix + name + str(epoch)
+        if batch < cfg.NUM_TRAIN_BATCHES:
+            path += "_step%d" % step
+        entry = {"path": path, "phase": phase, "epoch": epoch, "batch": batch,
+                 "step": step, "val_loss": val_loss}
+        logging.info("Saving Checkpoint %s (snapshot %.2fs)", path, time.time() - start)
+        if self.metrics is not None:
+            self.metrics.observe("checkpoint_snapshot_seconds", time.time() - start)
+        self.thread = threading.Thread(target=self._write, args=(entry, start))
+        self.thread.start()
+
+    def wait(self):
+        """Blocks until the pending write finishes and re-raises its error."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _write(self, entry, start):
+        try:
+            self._write_checkpoint(entry, start)
+        except Exception as e:
+            logging.exception("Writing checkpoint %s failed", entry["path"])
+            self.error = e
+
+    def _write_checkpoint(self, entry, start):
+        self.saver.save(self.sess, entry["path"])
+        checkpoints = [c for c in self.state["checkpoints"] if c["path"] != entry["path"]]
+        checkpoints.append(entry)
+        keep = set(c["path"] for c in checkpoints[-self.keep:])
+        scored = [c for c in checkpoints if c["val_loss"] is not None]
+        if scored:
+            best = min(scored, key=lambda c: c["val_loss"])
+            keep.add(best["path"])
+            self.state["best"] = best["path"]
+        for c in checkpoints:
+            if c["path"] not in keep:
+                remove_checkpoint(c["path"])
+        self.state["checkpoints"] = [c for c in checkpoints if c["path"] in keep]
+        tmp = state_path(self.prefix) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.rename(tmp, state_path(self.prefix))
+        self.last_duration = time.time() - start
+        if self.metrics is not None:
+            self.metrics.observe("checkpoint_seconds", self.last_duration)
+        logging.info("Wrote %s in %.2fs", entry["path"], self.last_duration)
+
+    def resume_point(self, ckpt):
+        """(phase, epoch, batch, step) to continue from after restoring `ckpt`:
+        the first batch that still has to run."""
+        if not ckpt:
+            return ("pretrain", 1, 0, 0)
+        entries = [c for c in self.state["checkpoints"] if c["path"] == ckpt]
+        if entries:
+            c = entries[0]
+            phase, epoch, batch, step = c["phase"], c["epoch"], c["batch"], c["step"]
+        else:
+            # Checkpoint from before the state file: only the epoch is known.
+            phase = "adversarial" if "adversarial" in ckpt else "pretrain"
+            digits = ckpt[len(ckpt.rstrip("0123456789")):]
+            epoch = int(digits) if digits else 0
+            batch = cfg.NUM_TRAIN_BATCHES
+            step = epoch * cfg.NUM_TRAIN_BATCHES
+        if batch >= cfg.NUM_TRAIN_BATCHES:
+            epoch, batch = epoch + 1, 0
+        return (phase, epoch, batch, step)
@@ -1,7 +1,17 @@
 IMAGES = "/home/images/all/*"
+# Cached index of IMAGES (manifest.py, --manifest PATH) and the processes
+# scanning new files into it (None: glob IMAGES on every run). Manifest splits
+# are hashed per path and differ from the positional glob splits, so don't
+# switch a run between the two mid-training.
+MANIFEST = None
+MANIFEST_WORKERS = 8
 LOGS_DIR = "logs/"
 CHECKPOINT = "checkpoint/weights"
 USE_CHECKPOINT = True
+# Checkpoints kept on disk besides the best by validation MSE, and an optional
+# extra checkpoint every N training steps (None: at epoch ends only).
+CHECKPOINT_KEEP = 5
+CHECKPOINT_EVERY = None
 
 HR_HEIGHT = 96
 HR_WIDTH = 96
@@ -15,6 +25,21 @@ NUM_TRAIN_EPOCHS = 25
 TRAIN_RATIO = .7
 VAL_RATIO = .2
 PRETRAIN_ONLY = False
+FEED_FREE = False
+# Micro-batches of BATCH_SIZE whose gradients are summed per optimizer update.
+ACCUM_STEPS = 1
+UPSAMPLER = "deconv"
+NUM_RES_BLOCKS = 15
+GEN_CHANNELS = 64
+# Training steps between summary writes, and the metrics registry
+# (monitor.py): export interval in seconds, timings kept for quantiles and
+# the Prometheus text file (None: TensorBoard only).
+SUMMARY_EVERY = 1
+METRICS_INTERVAL = 30
+METRICS_WINDOW = 500
+METRICS_FILE = "logs/metrics.prom"
+PROFILE_STEPS = None
+PROFILE_PHASE = "pretrain"
 
 LEARNING_RATE = 1e-4
 AD_LOSS_WEIGHT = 10.
@@ -26,5 +51,94 @@ RANDOM_SEED = 1337
 
 MAX_FILES = None
 PREDICT_ONLY = False
+TEST_ONLY = False
 WEIGHTS = None
+FROZEN = None
+QUANTIZED = None
 MEM_FRAC = 0.9
+
+# Tiled inference: LR tile size, overlap between neighbouring tiles (LR
+# pixels) and number of tiles per generator run.
+TILE_PREDICT = False
+TILE_SIZE = 96
+TILE_OVERLAP = 32
+TILE_BATCH = 4
+# Tiles whose LR gradient energy (inference.tile_complexity) is below this
+# take bicubic instead of the generator (None: generator everywhere).
+ADAPTIVE_THRESHOLD = None
+
+# Streaming prediction over --predict-dir / --predict-list.
+PREDICT_DIR = None
+PREDICT_LIST = None
+OUTPUT_DIR = "images/"
+PREDICT_BATCH = 8
+DECODE_THREADS = 4
+ENCODE_THREADS = 4
+PREFETCH = 64
+SAVE_COMPARISONS = False
+STREAM_DOWNSCALE = True
+# On-disk cache of SR outputs keyed on input bytes and weights (--cache-dir).
+CACHE_DIR = None
+CACHE_MAX_BYTES = 1 << 30
+
+# Frame sequences (--sequence-dir): LR tile size and overlap, and the mean
+# absolute LR difference (0-255) below which a tile reuses its cached output.
+SEQUENCE_DIR = None
+SEQUENCE_TILE = 48
+SEQUENCE_OVERLAP = 16
+SEQUENCE_THRESHOLD = 1.
+
+# Loader: reader/decode threads per pipeline, random crops taken from each
+# decoded image, and random flips/transposes of training crops.
+READER_THREADS = 1
+CROPS_PER_DECODE = 1
+AUGMENT = False
+
+# Pre-cropped patch shards (--write-shards / --shards). Each epoch uses the
+# next of NUM_SHARD_SETS independent crop draws; with one set the same
+# patches come back every epoch, only batched differently.
+SHARDS = None
+WRITE_SHARDS = None
+CROPS_PER_IMAGE = 16
+SHARD_SIZE = 4096
+NUM_SHARD_SETS = 1
+SHARD_PREFETCH = 256
+SHARD_THREADS = 2
+
+# Post-training weight quantization (quantize.py); compresses the artifact,
+# inference still runs in float32.
+QUANT_MODE = "int8"
+QUANT_CALIBRATION_IMAGES = 16
+QUANT_MIN_PSNR = 40.
+
+# Distillation of a smaller student generator from a frozen teacher.
+DISTILL = False
+TEACHER_WEIGHTS = None
+TEACHER_RES_BLOCKS = 15
+TEACHER_CHANNELS = 64
+TEACHER_UPSAMPLER = "deconv"
+DISTILL_HR_WEIGHT = 0.
+
+# Fixed validation/test crops cached under EVAL_DIR (evaluate.py): crops per
+# image, images per split and generator batch size.
+EVAL_DIR = "eval/"
+EVAL_CROPS = 4
+EVAL_IMAGES = 1000
+EVAL_BATCH = 64
+
+# Multi-process inference (parallel.py): worker processes, intra-op threads
+# per worker (None: its share of the CPUs), inter-op threads and decode/encode
+# threads per worker.
+NUM_WORKERS = 4
+WORKER_THREADS = None
+WORKER_INTER_THREADS = 1
+WORKER_IO_THREADS = 2
+
+# Inference server (serve.py): requests of the same LR shape are batched up to
+# SERVE_MAX_BATCH or until the oldest has waited SERVE_MAX_WAIT seconds; beyond
+# SERVE_QUEUE outstanding requests new ones get a 503.
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8080
+SERVE_MAX_BATCH = 8
+SERVE_MAX_WAIT = 0.01
+SERVE_QUEUE = 64
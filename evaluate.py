@@ -0,0 +1,120 @@
+"""Fixed evaluation sets for validation and test.
+
+The crops of a split are drawn once with a fixed seed and cached in
+EVAL_DIR/<split>.npz together with their LR inputs and the bicubic baseline
+scores, so every epoch and every run scores the same pixels and evaluation
+only costs the generator forward passes.
+"""
+import hashlib
+import logging
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import tensorflow as tf
+from scipy.misc import imresize
+
+import config as cfg
+from metrics import Scores, evaluate_batch
+from patches import random_crops
+
+
+def _set_id(images, num_crops, seed):
+    h = hashlib.sha256()
+    for path in images:
+        h.update(path.encode() + b"\n")
+    h.update(repr((num_crops, seed, cfg.EVAL_IMAGES, cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.r)).encode())
+    return h.hexdigest()
+
+
+class EvalSet(object):
+    """HR crops, their LR inputs and the per-image bicubic baseline scores."""
+    def __init__(self, hr, lr, baseline):
+        self.hr = hr
+        self.lr = lr
+        self.baseline = Scores()
+        self.baseline.add(baseline)
+        self.per_image_baseline = baseline
+
+    def __len__(self):
+        return len(self.hr)
+
+
+def build_eval_set(images, downscale, num_crops=None, max_images=None, seed=None):
+    """Crops a seeded sample of at most `max_images` of `images` into
+    `num_crops` HR patches each. `downscale` maps a uint8 HR batch to its LR
+    batch, as for write_shards."""
+    num_crops = num_crops or cfg.EVAL_CROPS
+    max_images = max_images or cfg.EVAL_IMAGES
+    seed = cfg.RANDOM_SEED if seed is None else seed
+    rng = np.random.RandomState(seed)
+    images = sorted(images)
+    if len(images) > max_images:
+        images = sorted(rng.choice(images, max_images, replace=False))
+    seeds = rng.randint(0, 2 ** 31 - 1, size=len(images))
+    pool = ThreadPool(cfg.DECODE_THREADS)
+    hr = np.concatenate(list(pool.imap(lambda args: random_crops(args[0], num_crops, args[1]),
+            zip(images, seeds))))
+    pool.close()
+    if len(hr) == 0:
+        raise ValueError("No evaluation image is at least %dx%d" % (cfg.HR_HEIGHT, cfg.HR_WIDTH))
+    lr = np.concatenate([downscale(hr[i:i + cfg.EVAL_BATCH])
+            for i in range(0, len(hr), cfg.EVAL_BATCH)])
+    baseline = []
+    for i in range(0, len(hr), cfg.EVAL_BATCH):
+        bicubic = np.stack([imresize(img, cfg.r * 100, interp='bicubic')
+                for img in lr[i:i + cfg.EVAL_BATCH]])
+        baseline.append(evaluate_batch(bicubic, hr[i:i + cfg.EVAL_BATCH]))
+    baseline = dict((k, np.concatenate([b[k] for b in baseline])) for k in baseline[0])
+    return EvalSet(hr, lr, baseline)
+
+
+def load_eval_set(path, images, downscale, num_crops=None, seed=None):
+    """Returns the EvalSet cached at `path`, building it first if it is
+    missing or was built from a different image list or crop setting."""
+    num_crops = num_crops or cfg.EVAL_CROPS
+    seed = cfg.RANDOM_SEED if seed is None else seed
+    set_id = _set_id(images, num_crops, seed)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if str(data['id']) == set_id:
+                baseline = dict((k, data['baseline_' + k]) for k in ('mse', 'psnr', 'ssim'))
+                return EvalSet(data['hr'], data['lr'], baseline)
+    logging.info("Building evaluation set %s from %d images", path, len(images))
+    eval_set = build_eval_set(images, downscale, num_crops, seed=seed)
+    out_dir = os.path.dirname(path)
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    baseline = dict(('baseline_' + k, v) for k, v in eval_set.per_image_baseline.items())
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, hr=eval_set.hr, lr=eval_set.lr, id=set_id, **baseline)
+    os.rename(tmp, path)
+    return eval_set
+
+
+def evaluate(upscaler, eval_set, batch_size=None):
+    """Scores the generator behind `upscaler` on `eval_set` in batches of
+    `batch_size`."""
+    batch_size = batch_size or cfg.EVAL_BATCH
+    scores = Scores()
+    for i in range(0, len(eval_set), batch_size):
+        sr = upscaler.run(eval_set.lr[i:i + batch_size].astype(np.float32))
+        sr = np.maximum(np.minimum(sr, 255.0), 0.0)
+        scores.add(evaluate_batch(sr, eval_set.hr[i:i + batch_size]))
+    return scores
+
+
+def eval_summary(scores, eval_set):
+    """tf.Summary with the generator and bicubic mse/psnr/ssim."""
+    values = []
+    for k in ('mse', 'psnr', 'ssim'):
+        values.append(tf.Summary.Value(tag=k, simple_value=scores.mean(k)))
+        values.append(tf.Summary.Value(tag='bicubic_' + k,
+                simple_value=eval_set.baseline.mean(k)))
+    return tf.Summary(value=values)
+
+
+def log_scores(name, scores, eval_set):
+    logging.info("%s (%d crops) PSNR: %f (bicubic %f), SSIM: %f (bicubic %f)",
+            name, len(eval_set), scores.mean('psnr'), eval_set.baseline.mean('psnr'),
+            scores.mean('ssim'), eval_set.baseline.mean('ssim'))
@@ -0,0 +1,51 @@
+"""Exports the generator of a training checkpoint as a frozen inference
+graph: no D/ or optimizer variables, batch norm folded into the convolutions
+and every weight baked in as a constant.
+
+    python export.py --weights checkpoint/weights_adversarial25 --out checkpoint/generator.pb
+
+Load it with `python model.py --frozen checkpoint/generator.pb`.
+"""
+import argparse
+import glob
+import logging
+import os
+
+import tensorflow as tf
+
+import config as cfg
+from checkpoint import latest_checkpoint
+from inference import fold_generator, folded_generator, load_generator_params
+
+
+def export(checkpoint, out_path):
+    layers = fold_generator(load_generator_params(checkpoint))
+    graph = tf.Graph()
+    with graph.as_default():
+        images = tf.placeholder(tf.float32, [None, None, None, cfg.NUM_CHANNELS], name="input")
+        tf.identity(folded_generator(images, layers), name="output")
+    graph_def = graph.as_graph_def()
+    out_dir, name = os.path.split(os.path.abspath(out_path))
+    tf.train.write_graph(graph_def, out_dir, name, as_text=False)
+
+    ckpt_files = [checkpoint] + glob.glob(checkpoint + ".*")
+    ckpt_bytes = sum(os.path.getsize(f) for f in ckpt_files
+            if os.path.isfile(f) and not f.endswith(".meta"))
+    res_ops = len([n for n in graph_def.node if n.name.startswith("G/res1/")])
+    logging.info("Wrote %s: %d ops (%d per res_block), %.1f MB (checkpoint %.1f MB)",
+            out_path, len(graph_def.node), res_ops,
+            os.path.getsize(out_path) / 1e6, ckpt_bytes / 1e6)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str)
+    parser.add_argument('--out', type=str, default="checkpoint/generator.pb")
+    args = parser.parse_args()
+    if args.weights:
+        cfg.WEIGHTS = args.weights
+    checkpoint = latest_checkpoint()
+    if checkpoint is None:
+        raise ValueError("No checkpoint found at " + cfg.CHECKPOINT)
+    export(checkpoint, args.out)
@@ -0,0 +1,83 @@
+"""Fast-start inference: upscales images without building the training graph.
+
+    python infer.py --weights checkpoint/weights_adversarial25 lr1.png lr2.png
+
+Only the generator is built and only the G/ tensors of the checkpoint are
+read (see inference.load_upscaler). Inputs are taken as LR images unless
+--downscale is given, in which case they are cropped and downscaled the way
+model.py --predict-only does; scipy and the streaming code are only
+imported then. Time to first image is logged with a breakdown.
+"""
+import time
+_START = time.time()
+
+import argparse
+import logging
+import os
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import config as cfg
+from inference import load_upscaler
+
+
+def load_lr(path, downscale):
+    if downscale:
+        from stream import load_image
+        return load_image(path)[1]
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'), dtype=np.uint8)
+
+
+def main(args):
+    imported = time.time()
+    config = tf.ConfigProto()
+    config.gpu_options.allow_growth = True
+    sess = tf.Session(config=config)
+    upscaler = load_upscaler(sess)
+    sess.graph.finalize()
+    loaded = time.time()
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    for i, path in enumerate(args.inputs):
+        sr = upscaler.upscale(load_lr(path, args.downscale))
+        name = os.path.splitext(os.path.basename(path))[0]
+        Image.fromarray(np.round(sr).astype(np.uint8)).save(
+                os.path.join(args.output_dir, name + '_sr.JPEG'))
+        if i == 0:
+            first = time.time()
+            logging.info("Time to first image: %.2fs (imports %.2fs, build and restore %.2fs, "
+                    "first image %.2fs)", first - _START, imported - _START,
+                    loaded - imported, first - loaded)
+    if len(args.inputs) > 1:
+        elapsed = time.time() - first
+        logging.info("Upscaled %d more images in %.1fs", len(args.inputs) - 1, elapsed)
+    sess.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', nargs='+')
+    parser.add_argument('--weights', type=str)
+    parser.add_argument('--frozen', type=str)
+    parser.add_argument('--quantized', type=str)
+    parser.add_argument('--output-dir', type=str, default=cfg.OUTPUT_DIR)
+    parser.add_argument('--downscale', action="store_true")
+    parser.add_argument('--tile', action="store_true")
+    parser.add_argument('--adaptive-threshold', type=float)
+    args = parser.parse_args()
+    if args.weights:
+        cfg.WEIGHTS = args.weights
+    if args.frozen:
+        cfg.FROZEN = args.frozen
+    if args.quantized:
+        cfg.QUANTIZED = args.quantized
+    if args.tile:
+        cfg.TILE_PREDICT = True
+    if args.adaptive_threshold is not None:
+        cfg.ADAPTIVE_THRESHOLD = args.adaptive_threshold
+    main(args)
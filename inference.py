@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import tensorflow as tf
+
+import config as cfg
+from checkpoint import latest_checkpoint
+
+
+def tile_grid(length, tile, overlap):
+    """Start offsets of tiles of size `tile` covering [0, length).
+
+    Consecutive tiles overlap by at least `overlap` pixels; the last tile is
+    aligned to the end of the axis so every tile has the same size.
+    """
+    assert 0 <= overlap < tile, "overlap must be smaller than the tile"
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def feather_window(size, overlap, lead, trail):
+    """1-D blending weights for a tile of `size` output pixels.
+
+    On a side that faces another tile (`lead`/`trail`) the weight is zero for
+    the first quarter of the overlap, ramps linearly to one over the next half,
+    and is one after that. Two tiles overlapping by exactly `overlap` therefore
+    sum to one across the seam, and neither contributes pixels that sit closer
+    than overlap / 4 to its own border.
+    """
+    w = np.ones(size, dtype=np.float32)
+    if overlap == 0:
+        return w
+    d = np.arange(size, dtype=np.float32) + .5
+    ramp = np.clip((d - overlap / 4.) / (overlap / 2.), 0., 1.)
+    if lead:
+        w = np.minimum(w, ramp)
+    if trail:
+        w = np.minimum(w, ramp[::-1])
+    return w
+
+
+def tile_complexity(tiles):
+    """Gradient energy of a batch of LR tiles (N x H x W x C): the mean
+    squared horizontal plus vertical luma difference, in 8-bit units. Flat
+    regions such as sky or page background score close to zero."""
+    from metrics import to_y
+    y = to_y(np.asarray(tiles, dtype=np.float32))
+    dy = np.square(np.diff(y, axis=1)).mean(axis=(1, 2))
+    dx = np.square(np.diff(y, axis=2)).mean(axis=(1, 2))
+    return dx + dy
+
+
+def tile_layout(lr, tile, overlap):
+    """Edge-pads `lr` (H x W x C) to at least one tile and returns it with
+    the tile_grid offsets of its rows and columns."""
+    pad_h, pad_w = max(tile - lr.shape[0], 0), max(tile - lr.shape[1], 0)
+    if pad_h or pad_w:
+        lr = np.pad(lr, ((0, pad_h), (0, pad_w), (0, 0)), mode='edge')
+    return lr, tile_grid(lr.shape[0], tile, overlap), tile_grid(lr.shape[1], tile, overlap)
+
+
+def blend_tiles(ys, xs, tile, overlap, channels, sr_tiles):
+    """Feathers SR tiles into one image of the padded LR size times r.
+
+    `sr_tiles` yields ((y, x), sr_tile) for every LR offset of the ys x xs
+    grid, with sr_tile of shape [tile * r, tile * r, channels]; it may be a
+    generator so tiles are blended as they are produced.
+    """
+    r = cfg.r
+    out = np.zeros(((ys[-1] + tile) * r, (xs[-1] + tile) * r, channels), dtype=np.float32)
+    weight = np.zeros(out.shape[:2] + (1,), dtype=np.float32)
+    wy = dict((y, feather_window(tile * r, overlap * r, y > 0, y < ys[-1])) for y in ys)
+    wx = dict((x, feather_window(tile * r, overlap * r, x > 0, x < xs[-1])) for x in xs)
+    for (y, x), sr_tile in sr_tiles:
+        w = np.outer(wy[y], wx[x])[:, :, None]
+        out[y * r:(y + tile) * r, x * r:(x + tile) * r] += w * sr_tile
+        weight[y * r:(y + tile) * r, x * r:(x + tile) * r] += w
+    out /= weight
+    return out
+
+
+def receptive_field(num_blocks=None):
+    """LR pixels on each side of a pixel that can affect its generator
+    output: conv1, two convs per res_block, and about one more pixel for the
+    two stride-2 upsamplers and conv2 at 2x and 4x resolution."""
+    num_blocks = num_blocks or cfg.NUM_RES_BLOCKS
+    return 2 * num_blocks + 3
+
+
+def tiled_upscale(run_batch, lr, tile=None, overlap=None, batch_size=None,
+                  threshold=None, stats=None):
+    """Super-resolves `lr` (H x W x C) tile by tile.
+
+    `run_batch` maps a float32 array of shape [N, tile, tile, C] to the
+    generator output [N, tile * r, tile * r, C]; N never exceeds `batch_size`,
+    so peak activation memory is fixed by tile size and batch size alone and
+    does not grow with the image.
+
+    Tiles overlap by `overlap` LR pixels and are feathered together with
+    `feather_window`, so every pixel a tile contributes to lies at least
+    overlap / 4 LR pixels from that tile's inner borders. A blended pixel
+    therefore matches full-image inference to float rounding when
+    overlap / 4 >= receptive_field(), i.e. TILE_OVERLAP >= 4 * (2 *
+    NUM_RES_BLOCKS + 3) and TILE_SIZE > TILE_OVERLAP; images smaller than a
+    tile are edge-padded and differ from it at their borders. With the
+    defaults (15 blocks, receptive field 33, TILE_OVERLAP 32) that needs an
+    overlap of 132, so seam pixels see only 8 of their 33 pixels of context
+    and are not exact: the residual is confined to bands 2 * (33 - 8) LR
+    pixels wide around each seam and its size depends on the weights.
+
+    With a `threshold`, tiles whose tile_complexity is below it take the
+    bicubic upscale of the image instead of a generator run, feathered in
+    the same way. `stats`, if given, counts 'tiles' and 'generator_tiles'.
+    """
+    tile = tile or cfg.TILE_SIZE
+    overlap = cfg.TILE_OVERLAP if overlap is None else overlap
+    batch_size = batch_size or cfg.TILE_BATCH
+    r = cfg.r
+
+    height, width, channels = lr.shape
+    lr, ys, xs = tile_layout(lr, tile, overlap)
+    coords = [(y, x) for y in ys for x in xs]
+    num_tiles = len(coords)
+    flat = []
+    if threshold is not None:
+        scores = tile_complexity(np.stack([lr[y:y + tile, x:x + tile] for y, x in coords]))
+        flat = [c for c, s in zip(coords, scores) if s < threshold]
+        coords = [c for c, s in zip(coords, scores) if s >= threshold]
+    if stats is not None:
+        stats['tiles'] += num_tiles
+        stats['generator_tiles'] += len(coords)
+
+    def sr_tiles():
+        if flat:
+            # Only adaptive tiling pays for importing scipy (see infer.py).
+            from scipy.misc import imresize
+            bicubic = imresize(lr, r * 100, interp='bicubic').astype(np.float32)
+            for y, x in flat:
+                yield (y, x), bicubic[y * r:(y + tile) * r, x * r:(x + tile) * r]
+        for i in range(0, len(coords), batch_size):
+            chunk = coords[i:i + batch_size]
+            tiles = np.stack([lr[y:y + tile, x:x + tile] for y, x in chunk])
+            for pos, sr_tile in zip(chunk, run_batch(tiles.astype(np.float32))):
+                yield pos, sr_tile
+
+    out = blend_tiles(ys, xs, tile, overlap, channels, sr_tiles())
+    return out[:height * r, :width * r]
+
+
+class Upscaler(object):
+    """Runs a generator that was built once with unknown batch, height and
+    width, so every input size reuses the same ops instead of growing the
+    graph."""
+    def __init__(self, sess, images, output, feed=None):
+        self.sess = sess
+        self.images = images
+        self.output = output
+        self.feed = feed or {}
+
+    def run(self, batch):
+        feed_dict = dict(self.feed)
+        feed_dict[self.images] = batch
+        return self.sess.run(self.output, feed_dict=feed_dict)
+
+    def upscale(self, lr, tiled=None, threshold=None):
+        """Returns the SR image for `lr` (H x W x C), clipped to [0, 255].
+        A complexity `threshold` (default ADAPTIVE_THRESHOLD) implies tiling."""
+        if tiled is None:
+            tiled = cfg.TILE_PREDICT
+        if threshold is None:
+            threshold = cfg.ADAPTIVE_THRESHOLD
+        if tiled or threshold is not None:
+            sr = tiled_upscale(self.run, lr, threshold=threshold)
+        else:
+            sr = self.run(lr[None].astype(np.float32))[0]
+        return np.maximum(np.minimum(sr, 255.0), 0.0)
+
+
+def load_generator_params(checkpoint):
+    """Reads only the G/ tensors of `checkpoint` into NumPy."""
+    reader = tf.train.NewCheckpointReader(checkpoint)
+    return dict((name, reader.get_tensor(name))
+            for name in reader.get_variable_to_shape_map() if name.startswith("G/"))
+
+
+def num_res_blocks(params):
+    return max(int(m.group(1)) for m in
+            (re.match(r"G/res(\d+)/", name) for name in params) if m)
+
+
+def fold_batch_norm(params, scope, epsilon=cfg.BN_EPSILON):
+    """Returns (weights, bias) of the conv in `scope` with its inference-mode
+    batch norm folded in: gamma * (conv(x) - mean) / sqrt(var + eps) + beta."""
+    scale = params[scope + "/gamma"] / np.sqrt(params[scope + "/moving_variance"] + epsilon)
+    weights = params[scope + "/weights"] * scale
+    bias = params[scope + "/beta"] - params[scope + "/moving_mean"] * scale
+    return weights.astype(np.float32), bias.astype(np.float32)
+
+
+def fold_generator(params):
+    """Maps layer scope -> (weights, bias or None) for the folded generator."""
+    layers = {"G/conv1": (params["G/conv1/weights"], None)}
+    for i in range(1, num_res_blocks(params) + 1):
+        for conv in ("resconv1", "resconv2"):
+            scope = "G/res%d/%s" % (i, conv)
+            layers[scope] = fold_batch_norm(params, scope)
+    for scope in ("G/deconv1", "G/deconv2", "G/subpixel1", "G/subpixel2", "G/conv2"):
+        if scope + "/weights" in params:
+            layers[scope] = (params[scope + "/weights"], None)
+    return layers
+
+
+def folded_generator(images, layers):
+    """Same computation as GAN.generator in inference mode, with batch norm
+    folded into `layers` (see fold_generator). Weights may be arrays,
+    which become constants, or tensors."""
+    def conv(h, scope, relu=False):
+        weights, bias = layers[scope]
+        with tf.name_scope(scope + "/"):
+            h = tf.nn.conv2d(h, tf.convert_to_tensor(weights), [1, 1, 1, 1], padding='SAME')
+            if bias is not None:
+                h = tf.nn.bias_add(h, tf.convert_to_tensor(bias))
+            return tf.nn.relu(h) if relu else h
+
+    def deconv(h, scope):
+        weights = tf.convert_to_tensor(layers[scope][0])
+        with tf.name_scope(scope + "/"):
+            shape = tf.shape(h)
+            output_shape = tf.pack([shape[0], shape[1] * 2, shape[2] * 2,
+                    weights.get_shape()[2].value])
+            h = tf.nn.conv2d_transpose(h, weights, output_shape, [1, 2, 2, 1])
+            return tf.nn.relu(h)
+
+    def subpixel(h, scope):
+        h = conv(h, scope)
+        with tf.name_scope(scope + "/"):
+            return tf.nn.relu(tf.depth_to_space(h, 2))
+
+    h = conv(images, "G/conv1", relu=True)
+    i = 1
+    while "G/res%d/resconv1" % i in layers:
+        inp = h
+        h = conv(inp, "G/res%d/resconv1" % i, relu=True)
+        h = conv(h, "G/res%d/resconv2" % i)
+        with tf.name_scope("G/res%d/" % i):
+            h = tf.nn.relu(inp + h)
+        i += 1
+    for i in range(1, 3):
+        if "G/subpixel%d" % i in layers:
+            h = subpixel(h, "G/subpixel%d" % i)
+        else:
+            h = deconv(h, "G/deconv%d" % i)
+    return conv(h, "G/conv2")
+
+
+def load_frozen(sess, path):
+    """Imports a generator written by export.py into the session's graph."""
+    graph_def = tf.GraphDef()
+    with open(path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    images, output = tf.import_graph_def(graph_def,
+            return_elements=['input:0', 'output:0'], name='frozen')
+    return Upscaler(sess, images, output)
+
+
+def dequantize(entry):
+    """float32 weights of one quantize.py layer entry."""
+    weights = entry['weights'].astype(np.float32)
+    if 'scale' in entry:
+        weights *= entry['scale']
+    return weights
+
+
+def read_quantized(path):
+    """Layers of a quantize.py artifact, expanded to float32."""
+    entries = {}
+    with np.load(path) as data:
+        for key in data.files:
+            scope, kind = key.rsplit('/', 1)
+            entries.setdefault(scope, {})[kind] = data[key]
+    return dict((scope, (dequantize(entry), entry.get('bias')))
+            for scope, entry in entries.items())
+
+
+def load_quantized(sess, path):
+    """Builds the generator from a quantize.py artifact in the session's graph.
+    Reduced-precision weights are expanded to float32 once, at load time, so
+    this runs the float32 graph: quantization only shrinks the artifact."""
+    layers = read_quantized(path)
+    images = tf.placeholder(tf.float32, [None, None, None, cfg.NUM_CHANNELS])
+    return Upscaler(sess, images, folded_generator(images, layers))
+
+
+def write_folded(layers, out_dir):
+    """Writes folded `layers` as one .npy file per array, so that processes
+    can share them through load_folded's memory maps."""
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    index = {}
+    for scope, (weights, bias) in layers.items():
+        name = scope.replace('/', '_')
+        np.save(os.path.join(out_dir, name + "_weights.npy"), weights)
+        if bias is not None:
+            np.save(os.path.join(out_dir, name + "_bias.npy"), bias)
+        index[scope] = name
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+
+
+def load_folded(sess, weights_dir):
+    """Builds the generator from a write_folded directory. The arrays are
+    memory-mapped, so every process reading them shares the page cache, and
+    copied once into variables rather than baked into the GraphDef."""
+    with open(os.path.join(weights_dir, "index.json")) as f:
+        index = json.load(f)
+    layers, feed = {}, {}
+    for scope, name in index.items():
+        tensors = []
+        for kind in ("weights", "bias"):
+            path = os.path.join(weights_dir, "%s_%s.npy" % (name, kind))
+            if not os.path.exists(path):
+                tensors.append(None)
+                continue
+            array = np.load(path, mmap_mode='r')
+            value = tf.placeholder(tf.float32, array.shape)
+            tensors.append(tf.Variable(value, trainable=False, collections=[]))
+            feed[value] = array
+        layers[scope] = tuple(tensors)
+    images = tf.placeholder(tf.float32, [None, None, None, cfg.NUM_CHANNELS])
+    output = folded_generator(images, layers)
+    variables = [t for pair in layers.values() for t in pair if t is not None]
+    sess.run([v.initializer for v in variables], feed_dict=feed)
+    return Upscaler(sess, images, output)
+
+
+def load_upscaler(sess):
+    """Upscaler for FROZEN, QUANTIZED or the latest checkpoint. Checkpoints
+    go through fold_generator, so only the G/ tensors are read and no
+    training graph is built."""
+    if cfg.FROZEN:
+        return load_frozen(sess, cfg.FROZEN)
+    if cfg.QUANTIZED:
+        return load_quantized(sess, cfg.QUANTIZED)
+    checkpoint = latest_checkpoint()
+    if checkpoint is None:
+        raise ValueError("No checkpoint found at " + cfg.CHECKPOINT)
+    logging.info("Loading params from " + checkpoint)
+    layers = fold_generator(load_generator_params(checkpoint))
+    images = tf.placeholder(tf.float32, [None, None, None, cfg.NUM_CHANNELS])
+    return Upscaler(sess, images, folded_generator(images, layers))
@@ -0,0 +1,108 @@
+"""Load generator for serve.py: keeps `--concurrency` requests in flight and
+reports latency percentiles and throughput, e.g.
+
+    python loadgen.py --concurrency 16 --requests 2000 --sizes 24,64
+"""
+import argparse
+import io
+import json
+import threading
+import time
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+import numpy as np
+from PIL import Image
+
+
+def png_bytes(size, seed):
+    rng = np.random.RandomState(seed)
+    small = rng.randint(0, 256, (size // 4 + 1, size // 4 + 1, 3)).astype(np.uint8)
+    img = Image.fromarray(small).resize((size, size), Image.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def run(url, bodies, concurrency, num_requests):
+    """Sends `num_requests` POSTs from `concurrency` threads, cycling through
+    `bodies`. Returns (latencies of successful requests, rejected, failed,
+    wall time)."""
+    latencies = []
+    counts = {"rejected": 0, "failed": 0}
+    lock = threading.Lock()
+    next_id = [0]
+
+    def worker():
+        while True:
+            with lock:
+                i = next_id[0]
+                next_id[0] += 1
+            if i >= num_requests:
+                return
+            body = bodies[i % len(bodies)]
+            start = time.time()
+            try:
+                urlopen(Request(url, data=body, headers={"Content-Type": "image/png"})).read()
+                outcome = None
+            except HTTPError as e:
+                outcome = "rejected" if e.code == 503 else "failed"
+            except Exception:
+                outcome = "failed"
+            elapsed = time.time() - start
+            with lock:
+                if outcome:
+                    counts[outcome] += 1
+                else:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return np.array(latencies), counts["rejected"], counts["failed"], time.time() - start
+
+
+def main(args):
+    url = "http://%s:%d" % (args.host, args.port)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if args.image:
+        with open(args.image, 'rb') as f:
+            bodies = [f.read()]
+    else:
+        bodies = [png_bytes(size, i) for i, size in enumerate(sizes)]
+
+    latencies, rejected, failed, wall = run(url + "/upscale", bodies,
+            args.concurrency, args.requests)
+    report = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "ok": len(latencies),
+        "rejected": rejected,
+        "failed": failed,
+        "images_per_sec": len(latencies) / wall,
+        "latency_ms": dict(("p%d" % p, 1000. * np.percentile(latencies, p))
+                for p in (50, 90, 99)) if len(latencies) else {},
+        "server": json.loads(urlopen(url + "/stats").read().decode()),
+    }
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--sizes', type=str, default="24", help="LR sizes of the synthetic images")
+    parser.add_argument('--image', type=str, help="send this file instead of synthetic images")
+    parser.add_argument('--out', type=str)
+    main(parser.parse_args())
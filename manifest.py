@@ -0,0 +1,156 @@
+"""Cached index of the training images.
+
+    python manifest.py --images '/home/images/all/*' --workers 16
+
+The manifest (MANIFEST, tab-separated) records every file matching IMAGES
+with its mtime, byte size, format, width, height and channel count, read
+from the image header by a pool of worker processes. Later runs only probe
+files whose size or mtime changed and drop entries whose files are gone, so
+startup costs a glob plus a stat per file. Files that fail to open are kept
+with zero dimensions so they aren't probed again.
+
+Splits are assigned per file from a seeded hash of its path, so adding
+images never moves an existing image to another split.
+"""
+import argparse
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+
+from PIL import Image
+
+import config as cfg
+
+FIELDS = ("path", "mtime", "size", "format", "width", "height", "channels")
+# decode_jpeg(channels=3) expands grayscale, anything else it rejects.
+CHANNELS = {"L": 1, "RGB": 3, "CMYK": 4, "RGBA": 4, "LA": 2, "P": 1, "1": 1}
+
+
+class Entry(object):
+    __slots__ = FIELDS
+
+    def __init__(self, path, mtime, size, format="", width=0, height=0, channels=0):
+        self.path = path
+        self.mtime = float(mtime)
+        self.size = int(size)
+        self.format = format
+        self.width = int(width)
+        self.height = int(height)
+        self.channels = int(channels)
+
+    def row(self):
+        return "%s\t%r\t%d\t%s\t%d\t%d\t%d" % tuple(getattr(self, k) for k in FIELDS)
+
+    def valid(self):
+        return (self.format == "JPEG" and self.channels in (1, cfg.NUM_CHANNELS)
+                and self.width >= cfg.HR_WIDTH and self.height >= cfg.HR_HEIGHT)
+
+
+def _probe(args):
+    path, mtime, size = args
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            return Entry(path, mtime, size, image.format, width, height,
+                    CHANNELS.get(image.mode, 0))
+    except Exception:
+        return Entry(path, mtime, size)
+
+
+def read_manifest(path):
+    entries = {}
+    if not path or not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        if f.readline().rstrip("\n").split("\t") != list(FIELDS):
+            logging.info("Ignoring manifest %s with an unknown format", path)
+            return entries
+        for line in f:
+            entry = Entry(*line.rstrip("\n").split("\t"))
+            entries[entry.path] = entry
+    return entries
+
+
+def write_manifest(path, entries):
+    out_dir = os.path.dirname(path)
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\t".join(FIELDS) + "\n")
+        for p in sorted(entries):
+            f.write(entries[p].row() + "\n")
+    os.rename(tmp, path)
+
+
+def update_manifest(pattern=None, path=None, workers=None):
+    """Brings the manifest at `path` up to date with the files matching
+    `pattern` and returns {path: Entry} for all of them, valid or not."""
+    pattern = pattern or cfg.IMAGES
+    path = path or cfg.MANIFEST
+    workers = workers or cfg.MANIFEST_WORKERS
+    old = read_manifest(path)
+    entries, todo = {}, []
+    for p in glob.glob(pattern):
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        entry = old.get(p)
+        if entry is not None and entry.size == st.st_size and entry.mtime == st.st_mtime:
+            entries[p] = entry
+        else:
+            todo.append((p, st.st_mtime, st.st_size))
+    removed = len(set(old) - set(entries) - set(t[0] for t in todo))
+    if todo:
+        logging.info("Scanning %d new or changed images with %d workers", len(todo), workers)
+        # Spawned, not forked: callers may already be running TF threads.
+        ctx = multiprocessing.get_context('spawn') if hasattr(multiprocessing, 'get_context') \
+                else multiprocessing
+        pool = ctx.Pool(workers)
+        for entry in pool.imap_unordered(_probe, todo, chunksize=256):
+            entries[entry.path] = entry
+        pool.close()
+        pool.join()
+    if todo or removed:
+        write_manifest(path, entries)
+    num_valid = sum(1 for e in entries.values() if e.valid())
+    logging.info("Manifest %s: %d images, %d usable, %d scanned, %d removed",
+            path, len(entries), num_valid, len(todo), removed)
+    return entries
+
+
+def _split_key(path, seed):
+    h = hashlib.md5(("%d:%s" % (seed, path)).encode("utf-8")).hexdigest()
+    return int(h[:15], 16) / float(16 ** 15)
+
+
+def split_images(entries, seed=None, max_files=None):
+    """Returns (train, val, test) lists of the usable images in `entries`,
+    split by TRAIN_RATIO / VAL_RATIO on a seeded hash of each path. With
+    `max_files` only that many images, picked by the same hash, are used."""
+    seed = cfg.RANDOM_SEED if seed is None else seed
+    max_files = max_files or cfg.MAX_FILES
+    keyed = sorted((_split_key(p, seed), p) for p, e in entries.items() if e.valid())
+    if max_files:
+        keyed = keyed[:max_files]
+    splits = ([], [], [])
+    for _, p in keyed:
+        u = _split_key(p, seed + 1)
+        ind = 0 if u < cfg.TRAIN_RATIO else 1 if u < cfg.TRAIN_RATIO + cfg.VAL_RATIO else 2
+        splits[ind].append(p)
+    return tuple(sorted(s) for s in splits)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=str)
+    parser.add_argument('--manifest', type=str)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    entries = update_manifest(args.images, args.manifest, args.workers)
+    train, val, test = split_images(entries)
+    logging.info("Split: %d train, %d val, %d test", len(train), len(val), len(test))
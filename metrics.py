@@ -0,0 +1,87 @@
+import numpy as np
+
+K1 = 0.01
+K2 = 0.03
+L = 255 # bitdepth of image
+WINDOW_SIZE = 11
+WINDOW_SIGMA = 1.5
+BORDER = 4
+
+
+def gauss1D(size=WINDOW_SIZE, sigma=WINDOW_SIGMA):
+    """1-D factor of matlab_style_gauss2D: outer(g, g) is the 2-D window."""
+    m = (size - 1.) / 2.
+    x = np.arange(-m, m + 1)
+    g = np.exp(-(x * x) / (2. * sigma * sigma))
+    return g / g.sum()
+
+
+def to_y(imgs):
+    """Same luma weights as model.to_y, over the last axis of a batch."""
+    return .229 * imgs[..., 0] + .587 * imgs[..., 1] + .114 * imgs[..., 2]
+
+
+def filter_valid(x, g):
+    """Separable 'valid' filtering of the last two axes of `x` with `g`."""
+    k = len(g)
+    h = x.shape[-2] - k + 1
+    out = g[0] * x[..., 0:h, :]
+    for i in range(1, k):
+        out += g[i] * x[..., i:i + h, :]
+    w = x.shape[-1] - k + 1
+    res = g[0] * out[..., 0:w]
+    for i in range(1, k):
+        res += g[i] * out[..., i:i + w]
+    return res
+
+
+def ssim_batch(imgs1, imgs2):
+    """Per-image SSIM of two N x H x W x C batches.
+
+    Matches model.ssim image for image: the same uint8 cast, 4 pixel border
+    crop, Y conversion and 11x11 Gaussian window. The window is applied as two
+    1-D passes over all five statistics of the whole batch at once.
+    """
+    y1 = to_y(np.asarray(imgs1).astype(np.uint8)[:, BORDER:-BORDER, BORDER:-BORDER])
+    y2 = to_y(np.asarray(imgs2).astype(np.uint8)[:, BORDER:-BORDER, BORDER:-BORDER])
+    C1 = (K1 * L) ** 2
+    C2 = (K2 * L) ** 2
+    mu1, mu2, s11, s22, s12 = filter_valid(
+        np.stack([y1, y2, y1 * y1, y2 * y2, y1 * y2]), gauss1D())
+    mu1_sq = mu1 * mu1
+    mu2_sq = mu2 * mu2
+    mu1_mu2 = mu1 * mu2
+    sigma1_sq = s11 - mu1_sq
+    sigma2_sq = s22 - mu2_sq
+    sigma12 = s12 - mu1_mu2
+    ssim_map = (((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) /
+            ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2)))
+    return ssim_map.reshape(len(ssim_map), -1).mean(axis=1)
+
+
+def evaluate_batch(pred, target):
+    """Scores a batch of predictions against targets (N x H x W x C, 0-255).
+
+    Returns a dict of per-image arrays: 'mse', 'psnr' and 'ssim'.
+    """
+    pred = np.asarray(pred, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    mse = np.square(pred - target).reshape(len(pred), -1).mean(axis=1)
+    with np.errstate(divide='ignore'):
+        psnr = 10. * np.log10(float(L * L) / mse)
+    return {'mse': mse, 'psnr': psnr, 'ssim': ssim_batch(pred, target)}
+
+
+class Scores(object):
+    """Accumulates per-image results of evaluate_batch across batches."""
+    def __init__(self):
+        self.sums = {}
+        self.count = 0
+
+    def add(self, scores):
+        for k, v in scores.items():
+            self.sums[k] = self.sums.get(k, 0.) + np.sum(v)
+        self.count += len(scores['mse'])
+
+    def mean(self, key):
+        return self.sums.get(key, 0.) / max(self.count, 1)
@@ -6,18 +6,28 @@ import argparse
 import logging
 import os
 import sys
+import time
 import config as cfg
-import re
 from scipy.misc import imresize, toimage
 from PIL import Image
 from scipy import signal, ndimage
 
-from blocks import relu_block, res_block, deconv_block, conv_block, dense_block
+from blocks import relu_block, res_block, deconv_block, subpixel_block, conv_block, dense_block
+from inference import Upscaler, load_frozen, load_quantized
+from stream import list_inputs, predict_stream
+from sequence import predict_sequence
+from cache import ResultCache, weights_id
+from patches import SPLITS, ShardLoader, write_shards
+from metrics import Scores, evaluate_batch
+from evaluate import eval_summary, evaluate, load_eval_set, log_scores
+import profiling
+from monitor import Monitor
+from checkpoint import AsyncCheckpointer, latest_checkpoint
+from manifest import split_images, update_manifest
 
 logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
 
 # TODO Start making hyperparameters command line options
-# TODO Randomize train/test/validation sets (seed)
 
 class Loader(object):
     def __init__(self, train_images, val_images, test_images):
@@ -27,38 +37,90 @@ class Loader(object):
         cfg.NUM_TRAIN_BATCHES = len(train_images) // cfg.BATCH_SIZE
         cfg.NUM_VAL_BATCHES = len(val_images) // cfg.BATCH_SIZE
         cfg.NUM_TEST_BATCHES = len(test_images) // cfg.BATCH_SIZE
-
-    def _get_pipeline(self, q):
-        reader = tf.WholeFileReader()
-        key, value = reader.read(q)
-        raw_img = tf.image.decode_jpeg(value, channels=cfg.NUM_CHANNELS)
-        my_img = tf.random_crop(raw_img, [cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS],
-                seed=cfg.RANDOM_SEED)
+        # (shuffle queue, capacity) per pipeline, so callers can watch their
+        # fill level.
+        self.queues = {}
+
+    def _augment(self, img, seed):
+        """Random flips and, for square crops, a random transpose: together
+        any of the 8 rotations and reflections of the crop. Uses op seeds
+        `seed` to `seed + 2`."""
+        img = tf.image.random_flip_left_right(img, seed=seed)
+        img = tf.image.random_flip_up_down(img, seed=seed + 1)
+        if cfg.HR_HEIGHT == cfg.HR_WIDTH:
+            transpose = tf.random_uniform([], seed=seed + 2) < .5
+            img = tf.cond(transpose, lambda: tf.transpose(img, [1, 0, 2]), lambda: img)
+            img.set_shape([cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS])
+        return img
+
+    def _get_pipeline(self, q, name, augment=False):
+        """READER_THREADS readers each decode one image at a time and enqueue
+        CROPS_PER_DECODE random crops of it into a shuffle queue."""
+        crop_shape = [cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS]
+        crops = []
+        for i in range(cfg.READER_THREADS):
+            reader = tf.WholeFileReader()
+            key, value = reader.read(q)
+            raw_img = tf.image.decode_jpeg(value, channels=cfg.NUM_CHANNELS)
+            patches = []
+            for j in range(cfg.CROPS_PER_DECODE):
+                # Distinct op seeds, or every crop would land in the same
+                # place: the crop takes seed, its augmentation seed + 1..3.
+                seed = cfg.RANDOM_SEED + 4 * (i * cfg.CROPS_PER_DECODE + j)
+                my_img = tf.random_crop(raw_img, crop_shape, seed=seed)
+                if augment:
+                    my_img = self._augment(my_img, seed + 1)
+                patches.append(my_img)
+            crops.append(tf.pack(patches))
         min_after_dequeue = 1000
-        capacity = min_after_dequeue + 3 * cfg.BATCH_SIZE
-        batch = tf.train.shuffle_batch([my_img], batch_size=cfg.BATCH_SIZE, capacity=capacity,
-                min_after_dequeue=min_after_dequeue, seed=cfg.RANDOM_SEED)
+        capacity = (min_after_dequeue + 3 * cfg.BATCH_SIZE +
+                cfg.READER_THREADS * cfg.CROPS_PER_DECODE)
+        queue = tf.RandomShuffleQueue(capacity, min_after_dequeue, [tf.uint8],
+                shapes=[crop_shape], seed=cfg.RANDOM_SEED, name=name + "_shuffle_queue")
+        tf.train.add_queue_runner(tf.train.QueueRunner(queue,
+                [queue.enqueue_many([c]) for c in crops]))
+        self.queues[name] = (queue, capacity)
+        batch = queue.dequeue_many(cfg.BATCH_SIZE)
         small_batch = tf.image.resize_bicubic(batch, [cfg.LR_HEIGHT, cfg.LR_WIDTH])
         return (small_batch, batch)
 
     def batch(self):
-        return (self._get_pipeline(self.q_train),
-                self._get_pipeline(self.q_val),
-                self._get_pipeline(self.q_test))
+        return (self._get_pipeline(self.q_train, "train", augment=cfg.AUGMENT),
+                self._get_pipeline(self.q_val, "val"),
+                self._get_pipeline(self.q_test, "test"))
 
 class GAN(object):
-    def __init__(self):
-        self.g_images = tf.placeholder(tf.float32, 
-            [cfg.BATCH_SIZE, cfg.LR_HEIGHT, cfg.LR_WIDTH, cfg.NUM_CHANNELS])
-        self.d_images = tf.placeholder(tf.float32,
-            [cfg.BATCH_SIZE, cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS])
-        self.is_training = tf.placeholder(tf.bool, shape=[])
+    def __init__(self, lr_images=None, hr_images=None, is_training=None):
+        """With `lr_images` / `hr_images` (e.g. a Loader batch) the model reads
+        its inputs straight from those tensors unless they are fed. Sub-models
+        (the distillation teacher) pass the parent's inputs and share its
+        `is_training`."""
         self.test_images = None
+        if is_training is not None:
+            self.g_images = lr_images
+            self.d_images = hr_images
+            self.is_training = is_training
+            return
+        g_shape = [cfg.BATCH_SIZE, cfg.LR_HEIGHT, cfg.LR_WIDTH, cfg.NUM_CHANNELS]
+        d_shape = [cfg.BATCH_SIZE, cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS]
+        if lr_images is None:
+            self.g_images = tf.placeholder(tf.float32, g_shape)
+        else:
+            self.g_images = tf.placeholder_with_default(
+                tf.cast(lr_images, tf.float32), g_shape)
+        if hr_images is None:
+            self.d_images = tf.placeholder(tf.float32, d_shape)
+        else:
+            self.d_images = tf.placeholder_with_default(
+                tf.cast(hr_images, tf.float32), d_shape)
+        self.is_training = tf.placeholder(tf.bool, shape=[])
 
-    def build_model(self, input_images=None):
+    def build_model(self, input_images=None, input_shape=None):
         if input_images is not None:
+            input_shape = input_images.shape
+        if input_shape is not None:
             with tf.variable_scope("G", reuse=True) as scope:
-                self.test_images = tf.placeholder(tf.float32, input_images.shape)
+                self.test_images = tf.placeholder(tf.float32, input_shape)
                 scope.reuse_variables()
                 self.G = self.generator(reuse=True)
         else:
@@ -94,37 +156,67 @@ class GAN(object):
 
             t_vars = tf.trainable_variables()
 
-            self.d_vars = [var for var in t_vars if 'D/' in var.name]
-            self.g_vars = [var for var in t_vars if 'G/' in var.name]
+            self.d_vars = [var for var in t_vars if var.name.startswith('D/')]
+            self.g_vars = [var for var in t_vars if var.name.startswith('G/')]
 
             # TODO Missing VGG loss and regularization loss.
             # Also missing weighting on losses.
 
-    def generator(self, reuse=False):
+    def build_distillation(self):
+        """Adds a frozen teacher generator (TEACHER_* config) under teacher/G
+        on the same inputs, and the student's distillation loss: MSE to the
+        teacher's output, mixed with the HR MSE by DISTILL_HR_WEIGHT."""
+        with tf.variable_scope("teacher"):
+            with tf.variable_scope("G"):
+                teacher = GAN(self.g_images, self.d_images, tf.constant(False))
+                self.teacher_G = tf.stop_gradient(teacher.generator(
+                    num_blocks=cfg.TEACHER_RES_BLOCKS, channels=cfg.TEACHER_CHANNELS,
+                    upsampler=cfg.TEACHER_UPSAMPLER))
+        self.teacher_vars = [var for var in tf.all_variables()
+                if var.name.startswith('teacher/')]
+
+        self.teacher_loss = tf.reduce_mean(
+            tf.squared_difference(self.teacher_G, self.G))
+        self.distill_loss = ((1. - cfg.DISTILL_HR_WEIGHT) * self.teacher_loss
+            + cfg.DISTILL_HR_WEIGHT * self.mse_loss)
+        tf.scalar_summary('distill_loss', self.distill_loss)
+
+    def generator(self, reuse=False, num_blocks=None, channels=None, upsampler=None):
         """Returns model generator, which is a DeConvNet.
         Assumed properties:
             gen_input - a scalar
             batch_size
             dimensions of filters and other hyperparameters.
             ...
+        Depth, width and upsampler default to NUM_RES_BLOCKS, GEN_CHANNELS
+        and UPSAMPLER.
         """
+        num_blocks = num_blocks or cfg.NUM_RES_BLOCKS
+        channels = channels or cfg.GEN_CHANNELS
+        upsampler = upsampler or cfg.UPSAMPLER
+
         with tf.variable_scope("conv1"):
             if self.test_images is not None:
-                h = conv_block(self.test_images, relu=True, reuse=reuse)
+                h = conv_block(self.test_images, relu=True, output_channels=channels,
+                        reuse=reuse)
             else:
                 # noise = tf.random_normal(self.g_images.get_shape(), stddev=.03 * 255)
                 h = self.g_images
-                h = conv_block(self.g_images, relu=True, reuse=reuse)
+                h = conv_block(self.g_images, relu=True, output_channels=channels,
+                        reuse=reuse)
 
-        for i in range(1, 16):
+        for i in range(1, num_blocks + 1):
             with tf.variable_scope("res" + str(i)):
-                h = res_block(h, self.is_training, reuse=reuse)
-
-        with tf.variable_scope("deconv1"):
-            h = deconv_block(h)
+                h = res_block(h, self.is_training, reuse=reuse, channels=channels)
 
-        with tf.variable_scope("deconv2"):
-            h = deconv_block(h)
+        # Separate scopes per upsampler so deconv checkpoints keep loading.
+        for i in range(1, 3):
+            if upsampler == "subpixel":
+                with tf.variable_scope("subpixel" + str(i)):
+                    h = subpixel_block(h, output_channels=channels)
+            else:
+                with tf.variable_scope("deconv" + str(i)):
+                    h = deconv_block(h, output_channels=channels)
 
         with tf.variable_scope("conv2"):
             h = conv_block(h, output_channels=3, reuse=reuse)
@@ -222,6 +314,21 @@ def ssim(img1, img2, cs_map=False):
     return (((2*mu1_mu2 + C1)*(2*sigma12 + C2))/((mu1_sq + mu2_sq + C1)*
             (sigma1_sq + sigma2_sq + C2))).mean()
 
+def generator_flops(num_blocks=None, channels=None, upsampler=None):
+    """Multiply-adds per LR input pixel of GAN.generator, times two."""
+    num_blocks = num_blocks or cfg.NUM_RES_BLOCKS
+    c = channels or cfg.GEN_CHANNELS
+    upsampler = upsampler or cfg.UPSAMPLER
+    macs = 9 * cfg.NUM_CHANNELS * c + num_blocks * 2 * 9 * c * c
+    if upsampler == "subpixel":
+        # conv to 4c channels at 1x, then at 2x
+        macs += 9 * c * 4 * c * (1 + 4)
+    else:
+        # transposed convs scatter from 1x and 2x inputs
+        macs += 9 * c * c * (1 + 4)
+    macs += 9 * c * cfg.NUM_CHANNELS * cfg.r * cfg.r
+    return 2 * macs
+
 class SuperRes(object):
     def __init__(self, sess, loader):
         logging.info("Building Model.")
@@ -229,23 +336,100 @@ class SuperRes(object):
         self.loader = loader
         self.train_batch, self.val_batch, self.test_batch = loader.batch()
 
-        self.GAN = GAN()
+        if cfg.FEED_FREE:
+            self.GAN = GAN(*self.train_batch)
+        else:
+            self.GAN = GAN()
         self.GAN.build_model()
 
-        self.g_mse_optim = (tf.train.AdamOptimizer(cfg.LEARNING_RATE, beta1=cfg.BETA_1)
-            .minimize(self.GAN.mse_loss, var_list=self.GAN.g_vars))
-        self.d_optim = (tf.train.AdamOptimizer(cfg.LEARNING_RATE, beta1=cfg.BETA_1)
-            .minimize(self.GAN.d_loss, var_list=self.GAN.d_vars))
-        self.g_optim = (tf.train.AdamOptimizer(cfg.LEARNING_RATE, beta1=cfg.BETA_1)
-            .minimize(self.GAN.g_loss, var_list=self.GAN.g_vars))
+        if cfg.DISTILL:
+            self.GAN.build_distillation()
+            logging.info("Distilling: student %.1f KFLOPs per LR pixel, teacher %.1f",
+                generator_flops() / 1e3, generator_flops(cfg.TEACHER_RES_BLOCKS,
+                    cfg.TEACHER_CHANNELS, cfg.TEACHER_UPSAMPLER) / 1e3)
+            self.pretrain_loss = self.GAN.distill_loss
+        else:
+            self.pretrain_loss = self.GAN.mse_loss
+
+        # With DISTILL the pre-training phase trains the student on
+        # distill_loss instead of mse_loss.
+        self.g_mse_optim = self._minimize(
+            tf.train.AdamOptimizer(cfg.LEARNING_RATE, beta1=cfg.BETA_1),
+            'distill_loss' if cfg.DISTILL else 'mse_loss', self.GAN.g_vars)
+        self.d_optim = self._minimize(
+            tf.train.AdamOptimizer(cfg.LEARNING_RATE, beta1=cfg.BETA_1),
+            'd_loss', self.GAN.d_vars)
+        self.g_optim = self._minimize(
+            tf.train.AdamOptimizer(cfg.LEARNING_RATE, beta1=cfg.BETA_1),
+            'g_loss', self.GAN.g_vars)
 
         batchnorm_updates = tf.get_collection(ops.GraphKeys.UPDATE_OPS)
-        self.pretrain = tf.group(self.g_mse_optim, *batchnorm_updates)
-        self.train = tf.group(self.d_optim, self.g_optim, *batchnorm_updates)
-
-    def predict(self, input_name, output_name, init_vars=False):
+        # Batch norm statistics are updated on every micro-batch; only the
+        # optimizer updates wait for ACCUM_STEPS micro-batches.
+        self.pretrain_accumulate = tf.group(self.g_mse_optim[0], *batchnorm_updates)
+        self.pretrain = tf.group(self.g_mse_optim[1], *batchnorm_updates)
+        self.train_accumulate = tf.group(self.d_optim[0], self.g_optim[0], *batchnorm_updates)
+        self.train = tf.group(self.d_optim[1], self.g_optim[1], *batchnorm_updates)
+        self.micro_step = 0
+        if cfg.ACCUM_STEPS > 1:
+            logging.info("Accumulating gradients over %d micro-batches of %d (effective batch %d)",
+                    cfg.ACCUM_STEPS, cfg.BATCH_SIZE, cfg.ACCUM_STEPS * cfg.BATCH_SIZE)
+
+        # Shares the G/ variables; built once with dynamic shapes so that
+        # prediction never adds ops to the graph.
+        self.test_GAN = GAN()
+        self.test_GAN.build_model(input_shape=(None, None, None, cfg.NUM_CHANNELS))
+        self.upscaler = Upscaler(sess, self.test_GAN.test_images, self.test_GAN.G,
+            {self.test_GAN.is_training: False})
+        self.saver = None
+        # Fixed evaluation sets (evaluate.py); without them validation and
+        # testing sample the loader's queues.
+        self.val_set = None
+        self.test_set = None
+
+    def _minimize(self, optimizer, loss, var_list):
+        """Returns (accumulate, update) ops minimizing the GAN attribute named
+        `loss`.
+
+        With ACCUM_STEPS > 1, `accumulate` adds the micro-batch gradients,
+        scaled by 1 / ACCUM_STEPS, into accumulator variables and `update`
+        does the same, then applies and clears the accumulators. Otherwise
+        both are the plain update.
+        """
+        grads = optimizer.compute_gradients(getattr(self.GAN, loss), var_list=var_list)
+        grads = [(g, v) for g, v in grads if g is not None]
+        if cfg.ACCUM_STEPS == 1:
+            update = optimizer.apply_gradients(grads)
+            return update, update
+
+        summed = []
+        for grad, var in grads:
+            # Local variables: not checkpointed and zeroed on every start.
+            with ops.colocate_with(var):
+                acc = tf.Variable(tf.zeros(var.get_shape(), dtype=var.dtype.base_dtype),
+                        trainable=False, collections=[ops.GraphKeys.LOCAL_VARIABLES],
+                        name=var.op.name.replace('/', '_') + '_' + loss + '_accum')
+                summed.append((acc, acc.assign_add(grad / cfg.ACCUM_STEPS)))
+        accumulate = tf.group(*[total for _, total in summed])
+        # Reading the assign_add outputs orders the apply after the last
+        # micro-batch's gradients are in.
+        apply = optimizer.apply_gradients([(total, var)
+                for (_, total), (_, var) in zip(summed, grads)])
+        with tf.control_dependencies([apply]):
+            update = tf.group(*[acc.assign(tf.zeros_like(acc)) for acc, _ in summed])
+        return accumulate, update
+
+    def _update_step(self):
+        """Counts a micro-batch; True when it completes an ACCUM_STEPS group
+        and the optimizers should apply."""
+        self.micro_step += 1
+        return self.micro_step % cfg.ACCUM_STEPS == 0
+
+    def predict(self, input_name, output_name, init_vars=False, tiled=None):
         if init_vars == True:
-            self._load_latest_checkpoint_or_initialize(tf.train.Saver())
+            if self.saver is None:
+                self.saver = tf.train.Saver()
+            self._load_latest_checkpoint_or_initialize(self.saver)
 
         with Image.open(input_name) as image:
             hr = np.asarray(image, dtype=np.uint8)
@@ -254,23 +438,13 @@ class SuperRes(object):
             hr = hr[:w,:h]
             lr = imresize(hr, 100 // cfg.r, interp='bicubic')
             bicubic = imresize(lr, cfg.r * 100, interp='bicubic')
-            image = np.reshape(lr, (1,) + lr.shape)
-            test_GAN = GAN()
-            test_GAN.build_model(input_images=image)
-            sr, loss = self.sess.run(
-                [test_GAN.G, test_GAN.mse_loss],
-                feed_dict={
-                    test_GAN.test_images: image,
-                    test_GAN.is_training: False
-            })
-            sr = np.maximum(np.minimum(sr[0][0], 255.0), 0.0)
-            print(bicubic.shape)
-            print(hr.shape)
-            bicubic_loss = np.mean(np.square((bicubic - hr)))
-            logging.info("MSE Loss: %f", loss)
-            logging.info("Bicubic MSE Loss: %f", bicubic_loss)
-
-            logging.info("SSIM - Bicubic %f, SR %f", ssim(bicubic, hr), ssim(sr, hr))
+            sr = self.upscaler.upscale(lr, tiled=tiled)
+            scores = evaluate_batch(np.stack([sr, bicubic]), np.stack([hr, hr]))
+            logging.info("MSE Loss: %f", scores['mse'][0])
+            logging.info("Bicubic MSE Loss: %f", scores['mse'][1])
+
+            logging.info("SSIM - Bicubic %f, SR %f", scores['ssim'][1], scores['ssim'][0])
+            logging.info("PSNR - Bicubic %f, SR %f", scores['psnr'][1], scores['psnr'][0])
 
             toimage(lr, cmin=0., cmax=255.).save(output_name + '_lr.JPEG')
             toimage(bicubic, cmin=0., cmax=255.).save(output_name + '_bc.JPEG')
@@ -278,82 +452,103 @@ class SuperRes(object):
             toimage(sr, cmin=0., cmax=255.).save(output_name + '_sr.JPEG')
 
     def _load_latest_checkpoint_or_initialize(self, saver, attempt_load=True):
-        if cfg.WEIGHTS:
-            logging.info("Loading params from " + cfg.WEIGHTS)
-            saver.restore(self.sess, cfg.WEIGHTS)
-            return cfg.WEIGHTS
-        ckpt_files = list(filter(lambda x: "meta" not in x, glob.glob(cfg.CHECKPOINT + "*")))
-        if attempt_load and len(ckpt_files) > 0:
-            ckpt_files.sort(key=lambda s: [int(t) if t.isdigit() else t.lower() for t in re.split('(\d+)', s)])
-            logging.info("Loading params from " + ckpt_files[-1])
-            saver.restore(self.sess, ckpt_files[-1])
-            return ckpt_files[-1]
+        ckpt = cfg.WEIGHTS or (latest_checkpoint() if attempt_load else None)
+        if ckpt:
+            logging.info("Loading params from " + ckpt)
+            saver.restore(self.sess, ckpt)
+            self.sess.run(tf.initialize_local_variables())
+            return ckpt
         else:
             logging.info("Initializing parameters")
-            self.sess.run(tf.initialize_all_variables())
+            self.sess.run([tf.initialize_all_variables(), tf.initialize_local_variables()])
             return ""
 
-    def _pretrain(self):
-        lr, hr = self.sess.run(self.train_batch)
-        summary, _, loss = self.sess.run(
-            [self.merged, self.pretrain, self.GAN.mse_loss],
-            feed_dict={
-                self.GAN.g_images: lr,
-                self.GAN.d_images: hr,
-                self.GAN.is_training: True
-        })
-        return summary, loss
-
-    def _train(self):
+    def _feed(self, batch, is_training):
+        """Returns the feed_dict for one step on `batch`. In FEED_FREE mode the
+        GAN reads the train batch straight from the queue, so only val and
+        test batches make the round trip through NumPy."""
+        feed_dict = {self.GAN.is_training: is_training}
+        if not (cfg.FEED_FREE and batch is self.train_batch):
+            lr, hr = self.sess.run(batch)
+            feed_dict[self.GAN.g_images] = lr
+            feed_dict[self.GAN.d_images] = hr
+        return feed_dict
+
+    def _load_teacher(self):
+        """Restores the teacher's G/ variables from TEACHER_WEIGHTS."""
+        if not cfg.TEACHER_WEIGHTS:
+            raise ValueError("Distillation needs --teacher-weights")
+        logging.info("Loading teacher from " + cfg.TEACHER_WEIGHTS)
+        saver = tf.train.Saver(dict((var.op.name[len('teacher/'):], var)
+                for var in self.GAN.teacher_vars))
+        saver.restore(self.sess, cfg.TEACHER_WEIGHTS)
+
+    def _log_distill_scores(self):
+        """Compares student and teacher against HR on one val batch."""
+        sr, teacher_sr, hr = self.sess.run(
+            [self.GAN.G, self.GAN.teacher_G, self.GAN.d_images],
+            feed_dict=self._feed(self.val_batch, False))
+        student = evaluate_batch(np.maximum(np.minimum(sr, 255.0), 0.0), hr)
+        teacher = evaluate_batch(np.maximum(np.minimum(teacher_sr, 255.0), 0.0), hr)
+        logging.info("Val SSIM: student %f, teacher %f; PSNR: student %f, teacher %f"
+                % (student['ssim'].mean(), teacher['ssim'].mean(),
+                   student['psnr'].mean(), teacher['psnr'].mean()))
+
+    def _pretrain(self, summarize=True, options=None, run_metadata=None):
+        """Returns (summary, loss); summary is None unless `summarize`."""
+        fetches = [self.pretrain if self._update_step() else self.pretrain_accumulate,
+                   self.pretrain_loss]
+        if summarize:
+            fetches.append(self.merged)
+        res = self.sess.run(fetches,
+            feed_dict=self._feed(self.train_batch, True),
+            options=options, run_metadata=run_metadata)
+        return (res[2] if summarize else None), res[1]
+
+    def _train(self, summarize=True, options=None, run_metadata=None):
         """
-        Returns (summary, mse_loss, g_ad_loss, g_loss, d_loss_real, d_loss_fake, d_loss)
+        Returns (summary, mse_loss, g_ad_loss, g_loss, d_loss_real, d_loss_fake, d_loss);
+        summary is None unless `summarize`.
         """
-        lr, hr = self.sess.run(self.val_batch)
-        res = self.sess.run(
-            [self.train, self.merged,
-             self.GAN.g_loss, self.GAN.mse_loss, self.GAN.g_ad_loss,
-             self.GAN.d_loss, self.GAN.d_loss_real, self.GAN.d_loss_fake],
-            feed_dict={
-                self.GAN.g_images: lr,
-                self.GAN.d_images: hr,
-                self.GAN.is_training: True
-        })
-
-        return res[1:]
-
-    def _val(self):
+        fetches = [self.train if self._update_step() else self.train_accumulate,
+                   self.GAN.g_loss, self.GAN.mse_loss, self.GAN.g_ad_loss,
+                   self.GAN.d_loss, self.GAN.d_loss_real, self.GAN.d_loss_fake]
+        if summarize:
+            fetches.append(self.merged)
+        res = self.sess.run(fetches,
+            feed_dict=self._feed(self.train_batch, True),
+            options=options, run_metadata=run_metadata)
+
+        return [res[7] if summarize else None] + res[1:7]
+
+    def _val(self, summarize=True):
         """
         Returns (summary, mse_loss, g_ad_loss, g_loss, d_loss_real, d_loss_fake, d_loss)
+        and the per-image scores of the generator output; summary is None
+        unless `summarize`.
         """
-        lr, hr = self.sess.run(self.train_batch)
-        res = self.sess.run(
-            [self.merged,
-             self.GAN.g_loss, self.GAN.mse_loss, self.GAN.g_ad_loss,
-             self.GAN.d_loss, self.GAN.d_loss_real, self.GAN.d_loss_fake],
-            feed_dict={
-                self.GAN.g_images: lr,
-                self.GAN.d_images: hr,
-                self.GAN.is_training: False
-        })
-
-        return res
-
-    def _test(self):
+        fetches = [self.GAN.g_loss, self.GAN.mse_loss, self.GAN.g_ad_loss,
+                   self.GAN.d_loss, self.GAN.d_loss_real, self.GAN.d_loss_fake,
+                   self.GAN.G, self.GAN.d_images]
+        if summarize:
+            fetches.append(self.merged)
+        res = self.sess.run(fetches, feed_dict=self._feed(self.val_batch, False))
+        sr = np.maximum(np.minimum(res[6], 255.0), 0.0)
+
+        return [res[8] if summarize else None] + res[:6], evaluate_batch(sr, res[7])
+
+    def _test(self, summarize=True):
         """
-        Returns (summary, mse_loss, g_ad_loss, g_loss, d_loss_real, d_loss_fake, d_loss)
+        Returns (summary, mse_loss, g_ad_loss, g_loss, d_loss_real, d_loss_fake, d_loss);
+        summary is None unless `summarize`.
         """
-        lr, hr = self.sess.run(self.test_batch)
-        res = self.sess.run(
-            [self.merged,
-             self.GAN.g_loss, self.GAN.mse_loss, self.GAN.g_ad_loss,
-             self.GAN.d_loss, self.GAN.d_loss_real, self.GAN.d_loss_fake],
-            feed_dict={
-                self.GAN.g_images: lr,
-                self.GAN.d_images: hr,
-                self.GAN.is_training: False
-        })
-
-        return res
+        fetches = [self.GAN.g_loss, self.GAN.mse_loss, self.GAN.g_ad_loss,
+                   self.GAN.d_loss, self.GAN.d_loss_real, self.GAN.d_loss_fake]
+        if summarize:
+            fetches.append(self.merged)
+        res = self.sess.run(fetches, feed_dict=self._feed(self.test_batch, False))
+
+        return [res[6] if summarize else None] + res[:6]
 
     def _print_losses(self, losses, count):
         avg_losses = [x / count for x in losses]
@@ -371,108 +566,198 @@ class SuperRes(object):
                 self.sess.graph)
         self.val_writer = tf.train.SummaryWriter(os.path.join(cfg.LOGS_DIR, 'val'),
                 self.sess.graph)
-        saver = tf.train.Saver(max_to_keep=None)
+        saver = tf.train.Saver()
         ckpt = self._load_latest_checkpoint_or_initialize(saver, attempt_load=cfg.USE_CHECKPOINT)
-        match = re.search(r'\d+$', ckpt)
-        done_batch = int(match.group(0)) if match else 0
+        if cfg.DISTILL:
+            self._load_teacher()
+        monitor = Monitor(self.sess, queues=getattr(self.loader, 'queues', None))
+        checkpointer = AsyncCheckpointer(sess=self.sess, metrics=monitor.metrics)
+        phase, start_epoch, start_batch, ind = checkpointer.resume_point(ckpt)
+        if ckpt:
+            logging.info("Resuming %s at epoch %d, batch %d (step %d)",
+                    phase, start_epoch, start_batch, ind)
+
+        profiler = profiling.from_config()
 
         sess = self.sess
         coord = tf.train.Coordinator()
         threads = tf.train.start_queue_runners(sess=sess, coord=coord)
+        monitor.start()
 
-        if "adversarial" not in ckpt:
+        if phase == "pretrain":
             # Pretrain
             logging.info("Begin Pre-Training")
-            ind = 0
-            for epoch in range(done_batch + 1, cfg.NUM_PRETRAIN_EPOCHS + 1):
+            self.micro_step = 0
+            for epoch in range(start_epoch, cfg.NUM_PRETRAIN_EPOCHS + 1):
                 logging.info("Pre-Training Epoch: %d" % (epoch,))
                 loss_sum = 0
-                for batch in range(cfg.NUM_TRAIN_BATCHES):
-                    summary, loss = self._pretrain()
-                    self.pre_train_writer.add_summary(summary, ind)
+                start = time.time()
+                for batch in range(start_batch, cfg.NUM_TRAIN_BATCHES):
+                    summarize = ind % cfg.SUMMARY_EVERY == 0
+                    step_start = time.time()
+                    if profiler:
+                        summary, loss = self._pretrain(summarize,
+                                **profiler.trace_args('pretrain', ind))
+                        profiler.record()
+                    else:
+                        summary, loss = self._pretrain(summarize)
+                    monitor.record_step("pretrain", ind, time.time() - step_start, cfg.BATCH_SIZE)
+                    if summary is not None:
+                        self.pre_train_writer.add_summary(summary, ind)
                     loss_sum += loss
                     ind += 1
-                logging.info("Epoch MSE Loss: %f" % (loss_sum / cfg.NUM_TRAIN_BATCHES,))
+                    if cfg.CHECKPOINT_EVERY and ind % cfg.CHECKPOINT_EVERY == 0:
+                        checkpointer.save("pretrain", epoch, batch + 1, ind)
+                num_batches = cfg.NUM_TRAIN_BATCHES - start_batch
+                start_batch = 0
+                logging.info("Epoch MSE Loss: %f (%.2f steps/sec)" % (loss_sum / num_batches,
+                        num_batches / (time.time() - start)))
+                if cfg.DISTILL:
+                    self._log_distill_scores()
 
                 if epoch % 4 == 0:
-                    logging.info("Saving Checkpoint")
-                    saver.save(sess, cfg.CHECKPOINT + str(epoch))
-            done_batch = 0
+                    checkpointer.save("pretrain", epoch, cfg.NUM_TRAIN_BATCHES, ind)
+            start_epoch, ind = 1, 0
         else:
             logging.info("Skipping Pre-Training")
 
         logging.info("Begin Training")
         # Adversarial training
-        ind = 0
         if not cfg.PRETRAIN_ONLY:
-            for epoch in range(done_batch + 1, cfg.NUM_TRAIN_EPOCHS + 1):
+            # Start a fresh accumulation group; leftovers in the pretrain
+            # accumulators are never applied.
+            self.micro_step = 0
+            for epoch in range(start_epoch, cfg.NUM_TRAIN_EPOCHS + 1):
                 logging.info("Training Epoch: %d" % (epoch,))
                 losses = [0 for _ in range(6)]
-                for batch in range(cfg.NUM_TRAIN_BATCHES):
-                    res = self._train()
-                    self.train_writer.add_summary(res[0], ind)
+                start = time.time()
+                for batch in range(start_batch, cfg.NUM_TRAIN_BATCHES):
+                    summarize = ind % cfg.SUMMARY_EVERY == 0
+                    step_start = time.time()
+                    if profiler:
+                        res = self._train(summarize, **profiler.trace_args('train', ind))
+                        profiler.record()
+                    else:
+                        res = self._train(summarize)
+                    monitor.record_step("train", ind, time.time() - step_start, cfg.BATCH_SIZE)
+                    if res[0] is not None:
+                        self.train_writer.add_summary(res[0], ind)
                     losses = [x + y for x, y in zip(losses, res[1:])]
                     ind += 1
                     if ind % 100 == 0:
                         self._print_losses(losses, 100)
                         losses = [0 for _ in range(6)]
+                    if cfg.CHECKPOINT_EVERY and ind % cfg.CHECKPOINT_EVERY == 0:
+                        checkpointer.save("adversarial", epoch, batch + 1, ind)
+                logging.info("Training: %.2f steps/sec" % (
+                        (cfg.NUM_TRAIN_BATCHES - start_batch) / (time.time() - start),))
+                start_batch = 0
 
                 # Validation
-                losses = [0 for _ in range(6)]
-                for batch in range(cfg.NUM_VAL_BATCHES):
-                    res = self._val()
-                    self.val_writer.add_summary(res[0], ind)
-                    losses = [x + y for x, y in zip(losses, res[1:])]
-                    ind += 1
-
-                logging.info("Epoch Validation Losses")
-                self._print_losses(losses, cfg.NUM_VAL_BATCHES)
-
-		logging.info("Saving Checkpoint (Adversarial)")
-                saver.save(sess, cfg.CHECKPOINT + "_adversarial" + str(epoch))
-
+                if self.val_set is not None:
+                    val_scores = evaluate(self.upscaler, self.val_set)
+                    self.val_writer.add_summary(eval_summary(val_scores, self.val_set), ind)
+                    log_scores("Validation", val_scores, self.val_set)
+                else:
+                    losses = [0 for _ in range(6)]
+                    val_scores = Scores()
+                    for batch in range(cfg.NUM_VAL_BATCHES):
+                        res, scores = self._val(ind % cfg.SUMMARY_EVERY == 0)
+                        if res[0] is not None:
+                            self.val_writer.add_summary(res[0], ind)
+                        losses = [x + y for x, y in zip(losses, res[1:])]
+                        val_scores.add(scores)
+                        ind += 1
+
+                    logging.info("Epoch Validation Losses")
+                    self._print_losses(losses, cfg.NUM_VAL_BATCHES)
+                    logging.info("Validation PSNR: %f, SSIM: %f"
+                            % (val_scores.mean('psnr'), val_scores.mean('ssim')))
+
+                checkpointer.save("adversarial", epoch, cfg.NUM_TRAIN_BATCHES, ind,
+                        val_loss=float(val_scores.mean('mse')))
+
+        checkpointer.wait()
+        monitor.close()
         coord.request_stop()
         coord.join(threads)
 
     def test_model(self):
-        val_writer = tf.train.SummaryWriter(join(cfg.LOGS_DIR, 'test'), self.sess.graph)
-
-        with self.sess as sess:
-            logging.info("Begin Testing")
-            # Test
-            coord = tf.train.Coordinator()
-            threads = tf.train.start_queue_runners(coord=coord)
-            ind = 0
-            for batch in range(cfg.NUM_TEST_BATCHES):
-                lr, hr = sess.run(self.test_batch)
-                res = self._test()
+        """Scores the generator on the fixed test set, or on NUM_TEST_BATCHES
+        batches of the test queue without one."""
+        test_writer = tf.train.SummaryWriter(os.path.join(cfg.LOGS_DIR, 'test'), self.sess.graph)
+        logging.info("Begin Testing")
+        if self.test_set is not None:
+            scores = evaluate(self.upscaler, self.test_set)
+            test_writer.add_summary(eval_summary(scores, self.test_set), 0)
+            log_scores("Test", scores, self.test_set)
+            return
+
+        self.merged = tf.merge_all_summaries()
+        coord = tf.train.Coordinator()
+        threads = tf.train.start_queue_runners(sess=self.sess, coord=coord)
+        losses = [0 for _ in range(6)]
+        for ind in range(cfg.NUM_TEST_BATCHES):
+            res = self._test(ind % cfg.SUMMARY_EVERY == 0)
+            if res[0] is not None:
                 test_writer.add_summary(res[0], ind)
-                losses = [x + y for x, y in zip(losses, res[1:])]
-                ind += 1
+            losses = [x + y for x, y in zip(losses, res[1:])]
 
-            logging.info("Test Losses")
-            self._print_losses(losses, cfg.NUM_TEST_BATCHES)
+        logging.info("Test Losses")
+        self._print_losses(losses, cfg.NUM_TEST_BATCHES)
 
-            coord.request_stop()
-            coord.join(threads)
+        coord.request_stop()
+        coord.join(threads)
 
 
 def main():
+    start = time.time()
+    # Image listing comes first: the manifest scan starts worker processes.
+    # Only runs that read the images build it; prediction and shard training
+    # get by with the glob.
+    if cfg.MANIFEST and (cfg.WRITE_SHARDS or not (cfg.PREDICT_ONLY or cfg.SHARDS)):
+        train_images, val_images, test_images = split_images(update_manifest())
+        cfg.NUM_IMAGES = len(train_images) + len(val_images) + len(test_images)
+        cfg.NUM_TRAIN_IMAGES = len(train_images)
+        cfg.NUM_VAL_IMAGES = len(val_images)
+    else:
+        file_list = glob.glob(cfg.IMAGES)
+        if cfg.MAX_FILES:
+            file_list = file_list[:cfg.MAX_FILES]
+        cfg.NUM_IMAGES = len(file_list)
+        cfg.NUM_TRAIN_IMAGES = int(cfg.NUM_IMAGES * cfg.TRAIN_RATIO)
+        cfg.NUM_VAL_IMAGES = int(cfg.NUM_IMAGES * cfg.VAL_RATIO)
+        train_images = file_list[:cfg.NUM_TRAIN_IMAGES]
+        val_images = file_list[cfg.NUM_TRAIN_IMAGES:cfg.NUM_TRAIN_IMAGES + cfg.NUM_VAL_IMAGES]
+        test_images = file_list[cfg.NUM_TRAIN_IMAGES + cfg.NUM_VAL_IMAGES:]
     config = tf.ConfigProto()
     config.gpu_options.allow_growth = True
     sess = tf.Session(config=config)
-    file_list = glob.glob(cfg.IMAGES)
-    if cfg.MAX_FILES:
-        file_list = file_list[:cfg.MAX_FILES]
-    cfg.NUM_IMAGES = len(file_list)
-    cfg.NUM_TRAIN_IMAGES = int(cfg.NUM_IMAGES * cfg.TRAIN_RATIO)
-    cfg.NUM_VAL_IMAGES = int(cfg.NUM_IMAGES * cfg.VAL_RATIO)
-    train_images = file_list[:cfg.NUM_TRAIN_IMAGES]
-    val_images = file_list[cfg.NUM_TRAIN_IMAGES:cfg.NUM_TRAIN_IMAGES + cfg.NUM_VAL_IMAGES]
-    test_images = file_list[cfg.NUM_TRAIN_IMAGES + cfg.NUM_VAL_IMAGES:]
-
-    loader = Loader(train_images, val_images, test_images)
+
+    # The Loader's bicubic resize, for crops prepared outside the queues.
+    hr = tf.placeholder(tf.uint8, [None, cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS])
+    lr = tf.image.resize_bicubic(hr, [cfg.LR_HEIGHT, cfg.LR_WIDTH])
+    lr = tf.cast(tf.clip_by_value(tf.round(lr), 0., 255.), tf.uint8)
+    downscale = lambda batch: sess.run(lr, feed_dict={hr: batch})
+
+    if cfg.WRITE_SHARDS:
+        for split, images in zip(SPLITS, (train_images, val_images, test_images)):
+            write_shards(images, os.path.join(cfg.WRITE_SHARDS, split), downscale)
+        sess.close()
+        return
+
+    if cfg.SHARDS:
+        loader = ShardLoader(cfg.SHARDS)
+    else:
+        loader = Loader(train_images, val_images, test_images)
     model = SuperRes(sess, loader)
+    if cfg.EVAL_DIR and not cfg.SHARDS and not cfg.PREDICT_ONLY:
+        if val_images and not cfg.TEST_ONLY:
+            model.val_set = load_eval_set(os.path.join(cfg.EVAL_DIR, 'val.npz'),
+                    val_images, downscale)
+        if test_images:
+            model.test_set = load_eval_set(os.path.join(cfg.EVAL_DIR, 'test.npz'),
+                    test_images, downscale)
 
     TEST_IMGS = [
         "/home/images/imagenet/n09287968_7641.JPEG",
@@ -481,15 +766,42 @@ def main():
     ]
     OUT_FILE = "images/test_{i}"
 
-    if cfg.PREDICT_ONLY:
-        for i, img in enumerate(TEST_IMGS):
-            out_file = OUT_FILE.replace("{i}", str(i))
-            model.predict(img, out_file, init_vars=True)
+    # Weights behind model.upscaler, for the result cache; None after
+    # training, where they only exist in the session.
+    weights = None
+    if cfg.PREDICT_ONLY and cfg.FROZEN:
+        model.upscaler = load_frozen(sess, cfg.FROZEN)
+        weights = cfg.FROZEN
+    elif cfg.PREDICT_ONLY and cfg.QUANTIZED:
+        model.upscaler = load_quantized(sess, cfg.QUANTIZED)
+        weights = cfg.QUANTIZED
+    elif cfg.PREDICT_ONLY:
+        weights = model._load_latest_checkpoint_or_initialize(tf.train.Saver())
+    elif cfg.TEST_ONLY:
+        model._load_latest_checkpoint_or_initialize(tf.train.Saver())
+        model.test_model()
+        sess.close()
+        return
     else:
         model.train_model()
+    # Prediction must reuse the generator built in SuperRes; any op added
+    # from here on raises instead of silently growing the graph.
+    sess.graph.finalize()
+    if cfg.PREDICT_ONLY:
+        # Compare with infer.py, which skips the Loader and training graph.
+        logging.info("Ready to predict after %.2fs", time.time() - start)
+    if cfg.SEQUENCE_DIR:
+        predict_sequence(model.upscaler, list_inputs(cfg.SEQUENCE_DIR), cfg.OUTPUT_DIR)
+    elif cfg.PREDICT_DIR or cfg.PREDICT_LIST:
+        paths = list_inputs(cfg.PREDICT_DIR, cfg.PREDICT_LIST)
+        cache = None
+        if cfg.CACHE_DIR and weights:
+            cache = ResultCache(cfg.CACHE_DIR, weights_id(weights))
+        predict_stream(model.upscaler, paths, cfg.OUTPUT_DIR, cache=cache)
+    else:
         for i, img in enumerate(TEST_IMGS):
             out_file = OUT_FILE.replace("{i}", str(i))
-            model.predict(img, out_file, init_vars=False)
+            model.predict(img, out_file)
     sess.close()
                   
 if __name__ == '__main__':
@@ -501,8 +813,57 @@ if __name__ == '__main__':
     parser.add_argument('--no-ckpt', action="store_true")
     parser.add_argument('--pretrain-only', action="store_true")
     parser.add_argument('--predict-only', action="store_true")
+    parser.add_argument('--test-only', action="store_true")
+    parser.add_argument('--eval-dir', type=str)
+    parser.add_argument('--no-eval-cache', action="store_true")
     parser.add_argument('--weights', type=str)
     parser.add_argument('--max-files', type=int)
+    parser.add_argument('--manifest', type=str)
+    parser.add_argument('--manifest-workers', type=int)
+    parser.add_argument('--tile', action="store_true")
+    parser.add_argument('--adaptive-threshold', type=float)
+    parser.add_argument('--tile-size', type=int)
+    parser.add_argument('--tile-overlap', type=int)
+    parser.add_argument('--tile-batch', type=int)
+    parser.add_argument('--predict-dir', type=str)
+    parser.add_argument('--predict-list', type=str)
+    parser.add_argument('--output-dir', type=str)
+    parser.add_argument('--predict-batch', type=int)
+    parser.add_argument('--decode-threads', type=int)
+    parser.add_argument('--encode-threads', type=int)
+    parser.add_argument('--save-comparisons', action="store_true")
+    parser.add_argument('--no-downscale', action="store_true")
+    parser.add_argument('--cache-dir', type=str)
+    parser.add_argument('--cache-max-mb', type=int)
+    parser.add_argument('--sequence-dir', type=str)
+    parser.add_argument('--sequence-threshold', type=float)
+    parser.add_argument('--write-shards', type=str)
+    parser.add_argument('--shards', type=str)
+    parser.add_argument('--crops-per-image', type=int)
+    parser.add_argument('--shard-sets', type=int)
+    parser.add_argument('--reader-threads', type=int)
+    parser.add_argument('--crops-per-decode', type=int)
+    parser.add_argument('--augment', action="store_true")
+    parser.add_argument('--feed-free', action="store_true")
+    parser.add_argument('--accum-steps', type=int)
+    parser.add_argument('--upsampler', choices=["deconv", "subpixel"])
+    parser.add_argument('--res-blocks', type=int)
+    parser.add_argument('--channels', type=int)
+    parser.add_argument('--checkpoint', type=str)
+    parser.add_argument('--checkpoint-keep', type=int)
+    parser.add_argument('--checkpoint-every', type=int)
+    parser.add_argument('--distill', action="store_true")
+    parser.add_argument('--teacher-weights', type=str)
+    parser.add_argument('--teacher-res-blocks', type=int)
+    parser.add_argument('--teacher-channels', type=int)
+    parser.add_argument('--teacher-upsampler', choices=["deconv", "subpixel"])
+    parser.add_argument('--distill-hr-weight', type=float)
+    parser.add_argument('--frozen', type=str)
+    parser.add_argument('--quantized', type=str)
+    parser.add_argument('--summary-every', type=int)
+    parser.add_argument('--metrics-file', type=str)
+    parser.add_argument('--profile-steps', type=str, help="start:end")
+    parser.add_argument('--profile-phase', choices=["pretrain", "train"])
 
     args = parser.parse_args()
     if args.num_epochs:
@@ -515,14 +876,116 @@ if __name__ == '__main__':
         cfg.USE_CHECKPOINT = False
     if args.max_files:
         cfg.MAX_FILES = args.max_files
+    if args.manifest:
+        cfg.MANIFEST = args.manifest
+    if args.manifest_workers:
+        cfg.MANIFEST_WORKERS = args.manifest_workers
     if args.pretrain_only:
         cfg.PRETRAIN_ONLY = True
     if args.predict_only:
         cfg.PREDICT_ONLY = True
+    if args.test_only:
+        cfg.TEST_ONLY = True
+    if args.eval_dir:
+        cfg.EVAL_DIR = args.eval_dir
+    if args.no_eval_cache:
+        cfg.EVAL_DIR = None
     if args.mem:
         cfg.MEM_FRAC = args.mem
     if args.weights:
         cfg.USE_CHECKPOINT = True
         cfg.WEIGHTS = args.weights
+    if args.tile:
+        cfg.TILE_PREDICT = True
+    if args.adaptive_threshold is not None:
+        cfg.ADAPTIVE_THRESHOLD = args.adaptive_threshold
+    if args.tile_size:
+        cfg.TILE_SIZE = args.tile_size
+    if args.tile_overlap is not None:
+        cfg.TILE_OVERLAP = args.tile_overlap
+    if args.tile_batch:
+        cfg.TILE_BATCH = args.tile_batch
+    if args.predict_dir:
+        cfg.PREDICT_DIR = args.predict_dir
+    if args.predict_list:
+        cfg.PREDICT_LIST = args.predict_list
+    if args.cache_dir:
+        cfg.CACHE_DIR = args.cache_dir
+    if args.cache_max_mb:
+        cfg.CACHE_MAX_BYTES = args.cache_max_mb << 20
+    if args.sequence_dir:
+        cfg.SEQUENCE_DIR = args.sequence_dir
+    if args.sequence_threshold is not None:
+        cfg.SEQUENCE_THRESHOLD = args.sequence_threshold
+    if cfg.PREDICT_DIR or cfg.PREDICT_LIST or cfg.SEQUENCE_DIR:
+        cfg.PREDICT_ONLY = True
+    if args.output_dir:
+        cfg.OUTPUT_DIR = args.output_dir
+    if args.predict_batch:
+        cfg.PREDICT_BATCH = args.predict_batch
+    if args.decode_threads:
+        cfg.DECODE_THREADS = args.decode_threads
+    if args.encode_threads:
+        cfg.ENCODE_THREADS = args.encode_threads
+    if args.save_comparisons:
+        cfg.SAVE_COMPARISONS = True
+    if args.no_downscale:
+        cfg.STREAM_DOWNSCALE = False
+    if args.write_shards:
+        cfg.WRITE_SHARDS = args.write_shards
+    if args.shards:
+        cfg.SHARDS = args.shards
+    if args.crops_per_image:
+        cfg.CROPS_PER_IMAGE = args.crops_per_image
+    if args.shard_sets:
+        cfg.NUM_SHARD_SETS = args.shard_sets
+    if args.reader_threads:
+        cfg.READER_THREADS = args.reader_threads
+    if args.crops_per_decode:
+        cfg.CROPS_PER_DECODE = args.crops_per_decode
+    if args.augment:
+        cfg.AUGMENT = True
+    if args.feed_free:
+        cfg.FEED_FREE = True
+    if args.accum_steps:
+        cfg.ACCUM_STEPS = args.accum_steps
+    if args.upsampler:
+        cfg.UPSAMPLER = args.upsampler
+    if args.res_blocks:
+        cfg.NUM_RES_BLOCKS = args.res_blocks
+    if args.channels:
+        cfg.GEN_CHANNELS = args.channels
+    if args.checkpoint:
+        cfg.CHECKPOINT = args.checkpoint
+    if args.checkpoint_keep:
+        cfg.CHECKPOINT_KEEP = args.checkpoint_keep
+    if args.checkpoint_every:
+        cfg.CHECKPOINT_EVERY = args.checkpoint_every
+    if args.distill:
+        cfg.DISTILL = True
+    if args.teacher_weights:
+        cfg.TEACHER_WEIGHTS = args.teacher_weights
+    if args.teacher_res_blocks:
+        cfg.TEACHER_RES_BLOCKS = args.teacher_res_blocks
+    if args.teacher_channels:
+        cfg.TEACHER_CHANNELS = args.teacher_channels
+    if args.teacher_upsampler:
+        cfg.TEACHER_UPSAMPLER = args.teacher_upsampler
+    if args.distill_hr_weight is not None:
+        cfg.DISTILL_HR_WEIGHT = args.distill_hr_weight
+    if args.frozen:
+        cfg.FROZEN = args.frozen
+        cfg.PREDICT_ONLY = True
+    if args.quantized:
+        cfg.QUANTIZED = args.quantized
+        cfg.PREDICT_ONLY = True
+    if args.summary_every:
+        cfg.SUMMARY_EVERY = args.summary_every
+    if args.metrics_file:
+        cfg.METRICS_FILE = args.metrics_file
+    if args.profile_steps:
+        cfg.PROFILE_STEPS = args.profile_steps
+    if args.profile_phase:
+        cfg.PROFILE_PHASE = args.profile_phase
 
     main()
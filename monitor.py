@@ -0,0 +1,153 @@
+"""In-process training metrics.
+
+Metrics keeps recent timings, gauges and counters. Monitor feeds it from the
+training loop and, every METRICS_INTERVAL seconds on a background thread,
+samples the input queue fill levels and exports everything as TensorBoard
+scalars (LOGS_DIR/metrics) and as a Prometheus text file (METRICS_FILE), e.g.
+for the node exporter's textfile collector.
+"""
+import collections
+import logging
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+import config as cfg
+
+QUANTILES = (50, 90, 99)
+
+
+class Metrics(object):
+    """Thread-safe registry of timings (the last `window` observations,
+    reported as quantiles), gauges and counters."""
+    def __init__(self, window=None):
+        self.window = window or cfg.METRICS_WINDOW
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.timing_counts = collections.Counter()
+        self.timing_sums = collections.Counter()
+        self.gauges = {}
+        self.counters = collections.Counter()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = collections.deque(maxlen=self.window)
+            self.timings[name].append(seconds)
+            self.timing_counts[name] += 1
+            self.timing_sums[name] += seconds
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def window_sum(self, name):
+        with self.lock:
+            return sum(self.timings.get(name, ()))
+
+    def snapshot(self):
+        """Flat dict of every current value, timings as name_pNN quantiles."""
+        with self.lock:
+            values = dict(self.gauges)
+            values.update(self.counters)
+            for name, obs in self.timings.items():
+                if not obs:
+                    continue
+                for q, v in zip(QUANTILES, np.percentile(list(obs), QUANTILES)):
+                    values["%s_p%d" % (name, q)] = v
+        return values
+
+    def summary(self):
+        return tf.Summary(value=[tf.Summary.Value(tag="metrics/" + name, simple_value=float(v))
+                for name, v in sorted(self.snapshot().items())])
+
+    def prometheus(self, prefix="superres_"):
+        """Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, obs in sorted(self.timings.items()):
+                metric = prefix + name
+                lines.append("# TYPE %s summary" % metric)
+                if obs:
+                    for q, v in zip(QUANTILES, np.percentile(list(obs), QUANTILES)):
+                        lines.append('%s{quantile="%g"} %f' % (metric, q / 100., v))
+                lines.append("%s_sum %f" % (metric, self.timing_sums[name]))
+                lines.append("%s_count %d" % (metric, self.timing_counts[name]))
+            for name, v in sorted(self.gauges.items()):
+                lines.append("# TYPE %s%s gauge" % (prefix, name))
+                lines.append("%s%s %f" % (prefix, name, v))
+            for name, v in sorted(self.counters.items()):
+                lines.append("# TYPE %s%s_total counter" % (prefix, name))
+                lines.append("%s%s_total %f" % (prefix, name, v))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.rename(tmp, path)
+
+
+class Monitor(object):
+    """Collects training step metrics and exports them periodically.
+
+    `queues` maps a name to (queue, capacity), as in Loader.queues; their
+    fill fraction is sampled at every export, so a queue that sits near
+    zero shows the input pipeline starving the model.
+    """
+    def __init__(self, sess, metrics=None, queues=None, interval=None,
+                 out_file=None, logdir=None):
+        self.sess = sess
+        self.metrics = metrics or Metrics()
+        self.interval = interval or cfg.METRICS_INTERVAL
+        self.out_file = cfg.METRICS_FILE if out_file is None else out_file
+        self.writer = tf.train.SummaryWriter(logdir or os.path.join(cfg.LOGS_DIR, 'metrics'))
+        queues = queues or {}
+        self.queue_sizes = dict((name, q.size()) for name, (q, _) in queues.items())
+        self.capacities = dict((name, float(c)) for name, (_, c) in queues.items())
+        self.step = 0
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.export()
+        self.writer.close()
+
+    def record_step(self, phase, step, seconds, images):
+        self.step = step
+        self.metrics.observe("step_seconds", seconds)
+        self.metrics.inc("images", images)
+        self.metrics.inc(phase + "_steps")
+        window = self.metrics.window_sum("step_seconds")
+        if window > 0:
+            steps = min(self.metrics.timing_counts["step_seconds"], self.metrics.window)
+            self.metrics.set("images_per_sec", steps * images / window)
+
+    def export(self):
+        if self.queue_sizes:
+            sizes = self.sess.run(self.queue_sizes)
+            for name, size in sizes.items():
+                self.metrics.set("queue_fill_" + name, size / self.capacities[name])
+        self.writer.add_summary(self.metrics.summary(), self.step)
+        if self.out_file:
+            self.metrics.write_prometheus(self.out_file)
+
+    def _loop(self):
+        while not self.stop.wait(self.interval):
+            try:
+                self.export()
+            except Exception:
+                logging.exception("Exporting metrics failed")
@@ -0,0 +1,213 @@
+"""Sharded batch inference over several worker processes.
+
+    python parallel.py --weights checkpoint/weights_adversarial25 \
+        --predict-dir frames/ --output-dir images/ --workers 8
+    python parallel.py --predict-dir frames/ --sweep --sweep-images 256
+
+The parent folds the generator once (inference.write_folded) into a temp
+directory that the workers memory-map. Each worker gets a contiguous share
+of the CPUs as its affinity set, an explicit intra-op / inter-op thread
+budget and every N-th input, which it runs through predict_stream. --sweep
+times combinations of workers, intra-op threads per worker and inter-op
+threads on a sample of the inputs and reports the fastest.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import tensorflow as tf
+
+import config as cfg
+from checkpoint import latest_checkpoint
+from inference import (fold_generator, load_folded, load_generator_params, read_quantized,
+                       write_folded)
+from stream import list_inputs, predict_stream
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def fold_weights(out_dir):
+    """Writes the folded generator for QUANTIZED or the latest checkpoint."""
+    if cfg.FROZEN:
+        raise ValueError("Frozen graphs can't be shared between workers; "
+                "use a checkpoint or --quantized")
+    if cfg.QUANTIZED:
+        layers = read_quantized(cfg.QUANTIZED)
+    else:
+        checkpoint = latest_checkpoint()
+        if checkpoint is None:
+            raise ValueError("No checkpoint found at " + cfg.CHECKPOINT)
+        logging.info("Folding " + checkpoint)
+        layers = fold_generator(load_generator_params(checkpoint))
+    write_folded(layers, out_dir)
+
+
+def _settings():
+    return dict((k, getattr(cfg, k)) for k in dir(cfg) if k.isupper())
+
+
+def _worker(settings, weights_dir, paths, output_dir, cpus, intra, inter, results):
+    # Workers are spawned, so config starts from its defaults here.
+    for k, v in settings.items():
+        setattr(cfg, k, v)
+    cfg.DECODE_THREADS = cfg.ENCODE_THREADS = cfg.WORKER_IO_THREADS
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    config = tf.ConfigProto(intra_op_parallelism_threads=intra,
+            inter_op_parallelism_threads=inter)
+    sess = tf.Session(config=config)
+    upscaler = load_folded(sess, weights_dir)
+    sess.graph.finalize()
+    start = time.time()
+    predict_stream(upscaler, paths, output_dir)
+    results.put((len(paths), time.time() - start))
+    sess.close()
+
+
+def run_workers(weights_dir, paths, output_dir, num_workers, threads=None, inter=None):
+    """Runs `num_workers` processes over `paths` and returns images/sec
+    measured from the first worker start to the last worker exit."""
+    cpus = available_cpus()
+    per_worker = max(len(cpus) // num_workers, 1)
+    threads = threads or per_worker
+    inter = inter or cfg.WORKER_INTER_THREADS
+    ctx = multiprocessing.get_context('spawn') if hasattr(multiprocessing, 'get_context') \
+            else multiprocessing
+    results = ctx.Queue()
+    settings = _settings()
+    procs = []
+    start = time.time()
+    for i in range(num_workers):
+        worker_cpus = cpus[i * per_worker:(i + 1) * per_worker] or cpus
+        procs.append(ctx.Process(target=_worker, args=(settings, weights_dir,
+                paths[i::num_workers], output_dir, worker_cpus, threads, inter, results)))
+        procs[-1].start()
+    # Drain the results before joining: a worker can't exit while its put is
+    # unflushed. A worker that dies puts nothing, so stop once every worker
+    # had exited before a get found the queue empty.
+    done = 0
+    received = 0
+    while received < num_workers:
+        exited = not any(p.is_alive() for p in procs)
+        try:
+            done += results.get(timeout=1)[0]
+            received += 1
+        except queue.Empty:
+            if exited:
+                break
+    elapsed = time.time() - start
+    for p in procs:
+        p.join()
+    failed = [p.exitcode for p in procs if p.exitcode != 0]
+    if failed:
+        raise RuntimeError("%d of %d workers failed" % (len(failed), num_workers))
+    return done / elapsed
+
+
+def _powers_of_two(limit):
+    """1, 2, 4, ... up to `limit`, plus `limit` itself."""
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def sweep(weights_dir, paths, output_dir, inter_threads=(1, 2)):
+    """Times every power-of-two worker count with every power-of-two number
+    of intra-op threads up to the worker's share of the CPUs, for each of
+    `inter_threads`, and returns the results fastest first."""
+    num_cpus = len(available_cpus())
+    results = []
+    for workers in _powers_of_two(num_cpus):
+        for threads in _powers_of_two(max(num_cpus // workers, 1)):
+            for inter in inter_threads:
+                speed = run_workers(weights_dir, paths, output_dir, workers, threads, inter)
+                logging.info("%3d workers x %3d threads (%d inter-op): %8.2f images/sec",
+                        workers, threads, inter, speed)
+                results.append({"workers": workers, "threads": threads, "inter_threads": inter,
+                                "images_per_sec": speed})
+    return sorted(results, key=lambda r: -r["images_per_sec"])
+
+
+def main(args):
+    paths = list_inputs(cfg.PREDICT_DIR, cfg.PREDICT_LIST)
+    weights_dir = tempfile.mkdtemp(prefix="folded_")
+    try:
+        fold_weights(weights_dir)
+        if args.sweep:
+            sample = paths[:args.sweep_images]
+            out_dir = tempfile.mkdtemp(prefix="sweep_")
+            try:
+                inter = [int(t) for t in args.sweep_inter_threads.split(",")]
+                results = sweep(weights_dir, sample, out_dir, inter)
+            finally:
+                shutil.rmtree(out_dir)
+            best = results[0]
+            logging.info("Best: %d workers x %d threads, %d inter-op (%.2f images/sec)",
+                    best["workers"], best["threads"], best["inter_threads"],
+                    best["images_per_sec"])
+            if args.out:
+                with open(args.out, "w") as f:
+                    json.dump({"cpus": len(available_cpus()), "images": len(sample),
+                               "results": results}, f, indent=2, sort_keys=True)
+        else:
+            speed = run_workers(weights_dir, paths, cfg.OUTPUT_DIR, args.workers or cfg.NUM_WORKERS,
+                    args.threads or cfg.WORKER_THREADS, args.inter_threads)
+            logging.info("Predicted %d images at %.2f images/sec", len(paths), speed)
+    finally:
+        shutil.rmtree(weights_dir)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str)
+    parser.add_argument('--quantized', type=str)
+    parser.add_argument('--predict-dir', type=str)
+    parser.add_argument('--predict-list', type=str)
+    parser.add_argument('--output-dir', type=str)
+    parser.add_argument('--no-downscale', action="store_true")
+    parser.add_argument('--tile', action="store_true")
+    parser.add_argument('--adaptive-threshold', type=float)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--threads', type=int, help="intra-op threads per worker")
+    parser.add_argument('--inter-threads', type=int)
+    parser.add_argument('--sweep', action="store_true")
+    parser.add_argument('--sweep-images', type=int, default=256)
+    parser.add_argument('--sweep-inter-threads', type=str, default="1,2",
+            help="inter-op thread counts to sweep")
+    parser.add_argument('--out', type=str, help="sweep results JSON")
+    args = parser.parse_args()
+    if args.weights:
+        cfg.WEIGHTS = args.weights
+    if args.quantized:
+        cfg.QUANTIZED = args.quantized
+    if args.predict_dir:
+        cfg.PREDICT_DIR = args.predict_dir
+    if args.predict_list:
+        cfg.PREDICT_LIST = args.predict_list
+    if args.output_dir:
+        cfg.OUTPUT_DIR = args.output_dir
+    if args.no_downscale:
+        cfg.STREAM_DOWNSCALE = False
+    if args.tile:
+        cfg.TILE_PREDICT = True
+    if args.adaptive_threshold is not None:
+        cfg.ADAPTIVE_THRESHOLD = args.adaptive_threshold
+    main(args)
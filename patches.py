@@ -0,0 +1,156 @@
+import glob
+import logging
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import config as cfg
+
+SPLITS = ("train", "val", "test")
+
+
+def random_crops(path, num_crops, seed):
+    """Decodes `path` once and returns `num_crops` random HR patches."""
+    with Image.open(path) as image:
+        img = np.asarray(image.convert('RGB'), dtype=np.uint8)
+    height, width = img.shape[:2]
+    if height < cfg.HR_HEIGHT or width < cfg.HR_WIDTH:
+        return np.zeros((0, cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS), dtype=np.uint8)
+    rng = np.random.RandomState(seed)
+    ys = rng.randint(0, height - cfg.HR_HEIGHT + 1, size=num_crops)
+    xs = rng.randint(0, width - cfg.HR_WIDTH + 1, size=num_crops)
+    return np.stack([img[y:y + cfg.HR_HEIGHT, x:x + cfg.HR_WIDTH] for y, x in zip(ys, xs)])
+
+
+def write_shards(images, out_dir, downscale, num_crops=None, shard_size=None,
+                 num_sets=None, seed=None):
+    """Crops `images` into fixed-size uint8 HR patches plus their LR
+    counterparts and writes them as shuffled .npy shards.
+
+    `downscale` maps a uint8 HR batch to its LR batch so the shards match the
+    bicubic resize used by Loader. Each of the `num_sets` sets
+    (out_dir/set_000, ...) holds an independent draw of random crops;
+    ShardLoader moves on to the next set every epoch.
+    """
+    num_crops = num_crops or cfg.CROPS_PER_IMAGE
+    shard_size = shard_size or cfg.SHARD_SIZE
+    num_sets = num_sets or cfg.NUM_SHARD_SETS
+    seed = cfg.RANDOM_SEED if seed is None else seed
+    pool = ThreadPool(cfg.DECODE_THREADS)
+
+    for set_ind in range(num_sets):
+        set_dir = os.path.join(out_dir, "set_%03d" % set_ind)
+        if not os.path.isdir(set_dir):
+            os.makedirs(set_dir)
+        rng = np.random.RandomState(seed + set_ind)
+        seeds = rng.randint(0, 2 ** 31 - 1, size=len(images))
+        crops = pool.imap(lambda args: random_crops(args[0], num_crops, args[1]),
+                zip(images, seeds))
+
+        buf, buf_len, shard_ind, total = [], 0, 0, 0
+        for patches in crops:
+            buf.append(patches)
+            buf_len += len(patches)
+            while buf_len >= shard_size:
+                hr = np.concatenate(buf)
+                _write_shard(set_dir, shard_ind, hr[:shard_size], downscale, rng)
+                buf, buf_len = [hr[shard_size:]], len(hr) - shard_size
+                shard_ind += 1
+                total += shard_size
+        if buf_len:
+            _write_shard(set_dir, shard_ind, np.concatenate(buf), downscale, rng)
+            total += buf_len
+        logging.info("Wrote %d patches to %s", total, set_dir)
+    pool.close()
+
+
+def _write_shard(set_dir, shard_ind, hr, downscale, rng):
+    # Shuffle within the shard so contiguous slices make good batches.
+    hr = hr[rng.permutation(len(hr))]
+    lr = downscale(hr)
+    np.save(os.path.join(set_dir, "hr_%05d.npy" % shard_ind), hr)
+    np.save(os.path.join(set_dir, "lr_%05d.npy" % shard_ind), lr)
+
+
+def _shard_batches(set_dir, batch_size):
+    """Number of full batches in the shards of `set_dir`; batches never
+    span shards."""
+    return sum(len(np.load(f, mmap_mode='r')) // batch_size
+            for f in glob.glob(os.path.join(set_dir, "hr_*.npy")))
+
+
+class _ShardSampler(object):
+    """Hands out (lr, hr) batches from memory-mapped shards. Every epoch
+    moves on to the next set and reshuffles the patches within each shard,
+    so batches are composed differently each epoch; with NUM_SHARD_SETS = 1
+    the patches themselves repeat every epoch. Each batch is gathered in
+    index order to keep the reads local."""
+    def __init__(self, split_dir, batch_size, seed):
+        self.sets = sorted(glob.glob(os.path.join(split_dir, "set_*")))
+        self.batch_size = batch_size
+        self.rng = np.random.RandomState(seed)
+        self.lock = threading.Lock()
+        self.set_ind = -1
+        self.order = []
+        self._next_set()
+
+    def _next_set(self):
+        self.set_ind = (self.set_ind + 1) % len(self.sets)
+        set_dir = self.sets[self.set_ind]
+        hr_files = sorted(glob.glob(os.path.join(set_dir, "hr_*.npy")))
+        self.hr = [np.load(f, mmap_mode='r') for f in hr_files]
+        self.lr = [np.load(f.replace("hr_", "lr_"), mmap_mode='r') for f in hr_files]
+        self.order = []
+        for s, shard in enumerate(self.hr):
+            perm = self.rng.permutation(len(shard))
+            self.order.extend((s, np.sort(perm[i:i + self.batch_size]))
+                    for i in range(0, len(shard) - self.batch_size + 1, self.batch_size))
+        self.rng.shuffle(self.order)
+        self.num_batches = len(self.order)
+
+    def next_batch(self):
+        with self.lock:
+            if not self.order:
+                self._next_set()
+            s, idx = self.order.pop()
+            return self.lr[s][idx], self.hr[s][idx]
+
+
+class ShardLoader(object):
+    """Drop-in replacement for Loader that samples pre-cropped patches from
+    shards written by write_shards instead of decoding JPEGs every step."""
+    def __init__(self, shard_dir):
+        for split in SPLITS:
+            sets = sorted(glob.glob(os.path.join(shard_dir, split, "set_*")))
+            if not sets:
+                raise ValueError("No shard sets in %s; write them with --write-shards"
+                        % os.path.join(shard_dir, split))
+            for set_dir in sets:
+                if _shard_batches(set_dir, cfg.BATCH_SIZE) == 0:
+                    raise ValueError("%s has no shard with a full batch of %d patches"
+                            % (set_dir, cfg.BATCH_SIZE))
+        self.samplers = [_ShardSampler(os.path.join(shard_dir, split), cfg.BATCH_SIZE,
+                cfg.RANDOM_SEED + i) for i, split in enumerate(SPLITS)]
+        cfg.NUM_TRAIN_BATCHES = self.samplers[0].num_batches
+        cfg.NUM_VAL_BATCHES = self.samplers[1].num_batches
+        cfg.NUM_TEST_BATCHES = self.samplers[2].num_batches
+        self.queues = {}
+
+    def _get_pipeline(self, sampler, name):
+        lr, hr = tf.py_func(sampler.next_batch, [], [tf.uint8, tf.uint8])
+        lr.set_shape([cfg.BATCH_SIZE, cfg.LR_HEIGHT, cfg.LR_WIDTH, cfg.NUM_CHANNELS])
+        hr.set_shape([cfg.BATCH_SIZE, cfg.HR_HEIGHT, cfg.HR_WIDTH, cfg.NUM_CHANNELS])
+        q = tf.FIFOQueue(cfg.SHARD_PREFETCH, [tf.uint8, tf.uint8],
+                shapes=[lr.get_shape()[1:], hr.get_shape()[1:]])
+        enqueue = q.enqueue_many([lr, hr])
+        tf.train.add_queue_runner(tf.train.QueueRunner(q, [enqueue] * cfg.SHARD_THREADS))
+        self.queues[name] = (q, cfg.SHARD_PREFETCH)
+        lr_batch, hr_batch = q.dequeue_many(cfg.BATCH_SIZE)
+        return (tf.cast(lr_batch, tf.float32), hr_batch)
+
+    def batch(self):
+        return tuple(self._get_pipeline(s, name) for s, name in zip(self.samplers, SPLITS))
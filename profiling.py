@@ -0,0 +1,102 @@
+import collections
+import logging
+import os
+import re
+
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+import config as cfg
+
+_PREFIXES = [
+    (re.compile(r'^gradients(_\d+)?/'), ' [grad]'),
+    (re.compile(r'^Adam(_\d+)?/update_'), ' [adam]'),
+]
+
+
+def scope_of(node_name, depth=2):
+    """Maps an op name to its block, e.g. 'gradients/G/res3/resconv1/Conv2D'
+    -> 'G/res3 [grad]'. Ops outside G/ and D/ fall back to their first
+    component."""
+    suffix = ''
+    stripped = True
+    while stripped:
+        stripped = False
+        for pattern, tag in _PREFIXES:
+            if pattern.match(node_name):
+                node_name = pattern.sub('', node_name, count=1)
+                suffix = suffix or tag
+                stripped = True
+    parts = node_name.split(':')[0].split('/')
+    if parts[0] in ('G', 'D'):
+        parts = parts[:depth]
+    else:
+        parts = parts[:1]
+    return '/'.join(parts) + suffix
+
+
+class StepProfiler(object):
+    """Traces the steps [start, end) of one training phase.
+
+    Each traced step writes a Chrome trace (chrome://tracing) to `out_dir`;
+    when the window closes, op time summed over it by variable scope is
+    logged and written to out_dir/<phase>_scopes.txt as a ranked table.
+    """
+    def __init__(self, phase, start, end, out_dir):
+        self.phase = phase
+        self.start = start
+        self.end = end
+        self.out_dir = out_dir
+        self.scope_micros = collections.defaultdict(int)
+        self.run_metadata = None
+        self.step = None
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+
+    def trace_args(self, phase, step):
+        """Returns the sess.run keyword arguments for `step`: a full trace
+        inside the window, nothing outside it."""
+        self.run_metadata = None
+        if phase != self.phase or not self.start <= step < self.end:
+            return {}
+        self.step = step
+        self.run_metadata = tf.RunMetadata()
+        return {'options': tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                'run_metadata': self.run_metadata}
+
+    def record(self):
+        """Stores the trace of the step started by the last trace_args."""
+        if self.run_metadata is None:
+            return
+        stats = self.run_metadata.step_stats
+        trace = timeline.Timeline(step_stats=stats).generate_chrome_trace_format()
+        path = os.path.join(self.out_dir, "%s_step%d.json" % (self.phase, self.step))
+        with open(path, 'w') as f:
+            f.write(trace)
+        for dev_stats in stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                self.scope_micros[scope_of(node_stats.node_name)] += node_stats.all_end_rel_micros
+        if self.step == self.end - 1:
+            self.report()
+
+    def report(self):
+        total = float(sum(self.scope_micros.values())) or 1.
+        steps = self.end - self.start
+        lines = ["%-28s %12s %7s" % ("scope", "ms/step", "share")]
+        for scope, micros in sorted(self.scope_micros.items(), key=lambda kv: -kv[1]):
+            lines.append("%-28s %12.3f %6.1f%%" % (scope, micros / 1000. / steps,
+                    100. * micros / total))
+        table = "\n".join(lines)
+        logging.info("Op time by scope, %s steps %d-%d:\n%s",
+                self.phase, self.start, self.end - 1, table)
+        with open(os.path.join(self.out_dir, "%s_scopes.txt" % self.phase), 'w') as f:
+            f.write(table + "\n")
+
+
+def from_config():
+    """StepProfiler for cfg.PROFILE_STEPS ("start:end"), or None."""
+    if not cfg.PROFILE_STEPS:
+        return None
+    start, end = [int(x) for x in cfg.PROFILE_STEPS.split(':')]
+    return StepProfiler(cfg.PROFILE_PHASE, start, end,
+            os.path.join(cfg.LOGS_DIR, 'profile'))
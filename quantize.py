@@ -0,0 +1,167 @@
+"""Post-training weight quantization of the BN-folded generator, for
+smaller artifacts on disk and over the wire.
+
+    python quantize.py --weights checkpoint/weights_adversarial25 --mode int8 \
+        --out checkpoint/generator_int8.npz
+
+Conv weights are stored as int8 with one scale per output channel, or as
+float16. A sample of IMAGES is used for calibration: every layer is tried
+quantized on its own, and layers that push the output below QUANT_MIN_PSNR
+against the float32 generator stay in float32. The artifact is loaded with
+`python model.py --quantized PATH`, and a JSON report with SSIM/PSNR against
+float32 and the weight sizes is written next to it.
+
+This is compression only: weights are expanded back to float32 when they
+load and inference runs the same float32 graph, so it is no faster.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from scipy.misc import imresize
+
+import config as cfg
+from checkpoint import latest_checkpoint
+from inference import dequantize, fold_generator, folded_generator, load_generator_params
+from metrics import evaluate_batch
+
+
+def channel_axis(scope):
+    """Output-channel axis: conv2d kernels are [h, w, in, out], conv2d_transpose
+    kernels [h, w, out, in]."""
+    return 2 if "deconv" in scope else 3
+
+
+def quantize(weights, axis, mode):
+    if mode == "float16":
+        return {"weights": weights.astype(np.float16)}
+    reduce_axes = tuple(i for i in range(weights.ndim) if i != axis)
+    scale = np.max(np.abs(weights), axis=reduce_axes, keepdims=True) / 127.
+    scale[scale == 0] = 1.
+    return {"weights": np.round(weights / scale).astype(np.int8),
+            "scale": scale.astype(np.float32)}
+
+
+def calibration_images(num_images, size):
+    """Center `size * r` HR crops of a seeded sample of IMAGES and their
+    bicubic LR versions."""
+    files = sorted(glob.glob(cfg.IMAGES))
+    rng = np.random.RandomState(cfg.RANDOM_SEED)
+    rng.shuffle(files)
+    hr_size = size * cfg.r
+    lrs, hrs = [], []
+    for path in files:
+        if len(hrs) == num_images:
+            break
+        with Image.open(path) as image:
+            img = np.asarray(image.convert('RGB'), dtype=np.uint8)
+        if img.shape[0] < hr_size or img.shape[1] < hr_size:
+            continue
+        y = (img.shape[0] - hr_size) // 2
+        x = (img.shape[1] - hr_size) // 2
+        hr = img[y:y + hr_size, x:x + hr_size]
+        hrs.append(hr)
+        lrs.append(imresize(hr, 100 // cfg.r, interp='bicubic'))
+    return np.stack(lrs).astype(np.float32), np.stack(hrs)
+
+
+class Evaluator(object):
+    """Generator whose weights are fed per run, so every quantization choice
+    is scored on the same graph."""
+    def __init__(self, sess, layers):
+        self.sess = sess
+        self.images = tf.placeholder(tf.float32, [None, None, None, cfg.NUM_CHANNELS])
+        self.weights = dict((scope, tf.placeholder(tf.float32, w.shape))
+                for scope, (w, _) in layers.items())
+        fed = dict((scope, (self.weights[scope], b)) for scope, (_, b) in layers.items())
+        self.output = folded_generator(self.images, fed)
+
+    def run(self, layers, lr):
+        feed_dict = dict((self.weights[scope], w) for scope, (w, _) in layers.items())
+        out = []
+        for i in range(0, len(lr), cfg.PREDICT_BATCH):
+            feed_dict[self.images] = lr[i:i + cfg.PREDICT_BATCH]
+            out.append(self.sess.run(self.output, feed_dict=feed_dict))
+        return np.maximum(np.minimum(np.concatenate(out), 255.0), 0.0)
+
+
+def main(args):
+    checkpoint = latest_checkpoint()
+    if checkpoint is None:
+        raise ValueError("No checkpoint found at " + cfg.CHECKPOINT)
+    layers = fold_generator(load_generator_params(checkpoint))
+    lr, hr = calibration_images(args.calibration, args.crop)
+    logging.info("Calibrating on %d images", len(lr))
+
+    sess = tf.Session()
+    evaluator = Evaluator(sess, layers)
+    reference = evaluator.run(layers, lr)
+
+    quantized = dict((scope, quantize(w, channel_axis(scope), args.mode))
+            for scope, (w, _) in layers.items())
+    keep_float = []
+    for scope in sorted(layers):
+        trial = dict(layers)
+        trial[scope] = (dequantize(quantized[scope]), layers[scope][1])
+        psnr = evaluate_batch(evaluator.run(trial, lr), reference)['psnr'].mean()
+        if psnr < cfg.QUANT_MIN_PSNR:
+            logging.info("Keeping %s in float32 (%.1f dB alone)", scope, psnr)
+            keep_float.append(scope)
+
+    arrays = {}
+    final = {}
+    for scope, (w, b) in layers.items():
+        entry = {"weights": w} if scope in keep_float else quantized[scope]
+        final[scope] = (dequantize(entry), b)
+        if b is not None:
+            entry = dict(entry, bias=b)
+        for kind, value in entry.items():
+            arrays[scope + "/" + kind] = value
+    np.savez(args.out, **arrays)
+
+    output = evaluator.run(final, lr)
+    vs_float = evaluate_batch(output, reference)
+    float_hr = evaluate_batch(reference, hr)
+    quant_hr = evaluate_batch(output, hr)
+    float_bytes = sum(w.nbytes + (b.nbytes if b is not None else 0) for w, b in layers.values())
+
+    report = {
+        "checkpoint": checkpoint,
+        "mode": args.mode,
+        "calibration_images": len(lr),
+        "float32_layers": sorted(keep_float),
+        "vs_float32": {"psnr": vs_float['psnr'].mean(), "ssim": vs_float['ssim'].mean()},
+        "vs_hr": {
+            "float32": {"psnr": float_hr['psnr'].mean(), "ssim": float_hr['ssim'].mean()},
+            "quantized": {"psnr": quant_hr['psnr'].mean(), "ssim": quant_hr['ssim'].mean()},
+        },
+        "weight_bytes": {"float32": float_bytes,
+                         "quantized": sum(a.nbytes for a in arrays.values())},
+    }
+    with open(os.path.splitext(args.out)[0] + ".json", "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    logging.info("vs float32: PSNR %.2f dB, SSIM %.4f; vs HR SSIM %.4f -> %.4f; "
+            "weights %.1f MB -> %.1f MB", report["vs_float32"]["psnr"],
+            report["vs_float32"]["ssim"], report["vs_hr"]["float32"]["ssim"],
+            report["vs_hr"]["quantized"]["ssim"], report["weight_bytes"]["float32"] / 1e6,
+            report["weight_bytes"]["quantized"] / 1e6)
+    sess.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str)
+    parser.add_argument('--mode', choices=["int8", "float16"], default=cfg.QUANT_MODE)
+    parser.add_argument('--out', type=str, default="checkpoint/generator_int8.npz")
+    parser.add_argument('--calibration', type=int, default=cfg.QUANT_CALIBRATION_IMAGES)
+    parser.add_argument('--crop', type=int, default=64, help="LR calibration crop size")
+    args = parser.parse_args()
+    if args.weights:
+        cfg.WEIGHTS = args.weights
+    main(args)
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+import config as cfg
+from inference import blend_tiles, tile_layout
+from stream import _DONE, _start_workers, load_image, save_outputs
+
+
+class SequenceUpscaler(object):
+    """Tiled upscaling that reuses SR tiles across consecutive frames.
+
+    Every frame is cut into the same overlapping LR tiles as tiled_upscale.
+    A tile whose bytes hash the same as the cached tile at its position, or
+    whose mean absolute difference from it is below `threshold`, reuses the
+    cached SR tile; only the remaining tiles go through the generator. The
+    comparison is against the tile that produced the cached output rather
+    than the previous frame, so slow drift still triggers a recompute.
+    """
+    def __init__(self, upscaler, threshold=None, tile=None, overlap=None, batch_size=None):
+        self.upscaler = upscaler
+        self.threshold = cfg.SEQUENCE_THRESHOLD if threshold is None else threshold
+        self.tile = tile or cfg.SEQUENCE_TILE
+        self.overlap = cfg.SEQUENCE_OVERLAP if overlap is None else overlap
+        self.batch_size = batch_size or cfg.TILE_BATCH
+        self.cache = {}
+        self.shape = None
+        self.tiles = 0
+        self.reused = 0
+
+    def reuse_ratio(self):
+        return self.reused / float(max(self.tiles, 1))
+
+    def _unchanged(self, cached, key, lr_tile):
+        if cached is None:
+            return False
+        if cached[0] == key:
+            return True
+        return (self.threshold > 0 and
+                np.mean(np.abs(lr_tile.astype(np.float32) - cached[1])) < self.threshold)
+
+    def upscale(self, lr):
+        """Returns the SR frame for `lr` (H x W x C), clipped to [0, 255]."""
+        tile, overlap, r = self.tile, self.overlap, cfg.r
+        height, width, channels = lr.shape
+        lr, ys, xs = tile_layout(lr, tile, overlap)
+        if lr.shape != self.shape:
+            self.cache = {}
+            self.shape = lr.shape
+        coords = [(y, x) for y in ys for x in xs]
+
+        changed = []
+        for y, x in coords:
+            lr_tile = lr[y:y + tile, x:x + tile]
+            key = hashlib.md5(np.ascontiguousarray(lr_tile).tobytes()).hexdigest()
+            if self._unchanged(self.cache.get((y, x)), key, lr_tile):
+                self.reused += 1
+            else:
+                changed.append(((y, x), key, lr_tile))
+        self.tiles += len(coords)
+        for i in range(0, len(changed), self.batch_size):
+            chunk = changed[i:i + self.batch_size]
+            sr = self.upscaler.run(np.stack([t for _, _, t in chunk]).astype(np.float32))
+            for (pos, key, lr_tile), sr_tile in zip(chunk, sr):
+                self.cache[pos] = (key, lr_tile.astype(np.float32), sr_tile)
+
+        out = blend_tiles(ys, xs, tile, overlap, channels,
+                ((pos, self.cache[pos][2]) for pos in coords))
+        return np.maximum(np.minimum(out[:height * r, :width * r], 255.0), 0.0)
+
+
+def predict_sequence(upscaler, paths, output_dir, threshold=None):
+    """Upscales the frames `paths` in order with a SequenceUpscaler. Decode
+    runs one frame ahead on a reader thread to keep the order, encode on
+    ENCODE_THREADS threads. Logs and returns the tile reuse ratio."""
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    seq = SequenceUpscaler(upscaler, threshold)
+
+    path_q = queue.Queue()
+    decoded_q = queue.Queue(maxsize=cfg.PREFETCH)
+    encode_q = queue.Queue(maxsize=cfg.PREFETCH)
+    for path in paths:
+        path_q.put(path)
+    path_q.put(_DONE)
+
+    def decode(path):
+        hr, lr = load_image(path)
+        return path, hr, lr
+
+    def encode(item):
+        path, hr, lr, sr = item
+        name = os.path.splitext(os.path.basename(path))[0]
+        save_outputs(os.path.join(output_dir, name), sr, lr, hr, cfg.SAVE_COMPARISONS)
+
+    _start_workers(decode, path_q, decoded_q, 1)
+    writers = _start_workers(encode, encode_q, None, cfg.ENCODE_THREADS)
+
+    start = time.time()
+    frames = 0
+    while True:
+        item = decoded_q.get()
+        if item is _DONE:
+            break
+        path, hr, lr = item
+        reused, tiles = seq.reused, seq.tiles
+        encode_q.put((path, hr, lr, seq.upscale(lr)))
+        frames += 1
+        logging.debug("%s: reused %d of %d tiles", path, seq.reused - reused, seq.tiles - tiles)
+
+    for _ in writers:
+        encode_q.put(_DONE)
+    for t in writers:
+        t.join()
+    elapsed = time.time() - start
+    logging.info("Upscaled %d frames in %.1fs (%.2f frames/sec), reused %d of %d tiles (%.1f%%)",
+            frames, elapsed, frames / max(elapsed, 1e-6), seq.reused, seq.tiles,
+            100. * seq.reuse_ratio())
+    return seq.reuse_ratio()
@@ -0,0 +1,257 @@
+"""Keeps the generator warm in one session and serves it over HTTP on
+localhost:
+
+    python serve.py --weights checkpoint/weights_adversarial25 --port 8080
+    curl --data-binary @lr.png http://127.0.0.1:8080/upscale > sr.png
+
+POST /upscale takes an encoded LR image and returns the SR image as PNG.
+GET /stats returns request and batching counters as JSON. Concurrent requests
+with the same LR shape are run as one generator batch (see MicroBatcher).
+Benchmark with loadgen.py.
+"""
+import argparse
+import collections
+import io
+import json
+import logging
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import config as cfg
+from inference import load_upscaler
+
+_DONE = object()
+
+
+class Request(object):
+    def __init__(self, lr):
+        self.lr = lr
+        self.arrival = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher(object):
+    """Groups concurrent requests into generator batches.
+
+    Requests are bucketed by LR shape. A bucket runs as soon as it holds
+    `max_batch` requests or its oldest request has waited `max_wait` seconds,
+    whichever comes first. At most `max_pending` requests may be outstanding;
+    submit() raises queue.Full beyond that instead of letting latency grow
+    without bound.
+    """
+    def __init__(self, upscaler, max_batch=None, max_wait=None, max_pending=None):
+        self.upscaler = upscaler
+        self.max_batch = max_batch or cfg.SERVE_MAX_BATCH
+        self.max_wait = cfg.SERVE_MAX_WAIT if max_wait is None else max_wait
+        self.slots = threading.Semaphore(max_pending or cfg.SERVE_QUEUE)
+        self.requests = queue.Queue()
+        self.stats = collections.Counter()
+        self.stats_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, lr):
+        """Queues `lr` (H x W x C) and returns its Request; wait on
+        request.done."""
+        if not self.slots.acquire(False):
+            with self.stats_lock:
+                self.stats["rejected"] += 1
+            raise queue.Full()
+        req = Request(lr)
+        self.requests.put(req)
+        return req
+
+    def snapshot(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def upscale(self, lr):
+        req = self.submit(lr)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def close(self):
+        self.requests.put(_DONE)
+        self.thread.join()
+
+    def _loop(self):
+        buckets = collections.OrderedDict()
+        while True:
+            timeout = None
+            if buckets:
+                oldest = min(bucket[0].arrival for bucket in buckets.values())
+                timeout = max(oldest + self.max_wait - time.time(), 0)
+            reqs = []
+            try:
+                reqs.append(self.requests.get(timeout=timeout))
+                # Everything that queued up while the last batch ran is
+                # bucketed before deadlines are checked, so it can share a batch.
+                while True:
+                    reqs.append(self.requests.get_nowait())
+            except queue.Empty:
+                pass
+            for req in reqs:
+                if req is _DONE:
+                    for shape in list(buckets):
+                        self._run(buckets.pop(shape))
+                    return
+                bucket = buckets.setdefault(req.lr.shape, [])
+                bucket.append(req)
+                if len(bucket) >= self.max_batch:
+                    self._run(buckets.pop(req.lr.shape))
+            now = time.time()
+            for shape in [s for s, b in buckets.items() if b[0].arrival + self.max_wait <= now]:
+                self._run(buckets.pop(shape))
+
+    def _run(self, reqs):
+        try:
+            if cfg.TILE_PREDICT or cfg.ADAPTIVE_THRESHOLD is not None:
+                srs = [self.upscaler.upscale(req.lr) for req in reqs]
+            else:
+                batch = np.stack([req.lr for req in reqs]).astype(np.float32)
+                srs = np.maximum(np.minimum(self.upscaler.run(batch), 255.0), 0.0)
+            for req, sr in zip(reqs, srs):
+                req.result = sr
+        except Exception as e:
+            logging.exception("Batch of %d failed", len(reqs))
+            for req in reqs:
+                req.error = e
+        with self.stats_lock:
+            self.stats["batches"] += 1
+            self.stats["images"] += len(reqs)
+        for req in reqs:
+            self.slots.release()
+            req.done.set()
+
+
+class Handler(BaseHTTPRequestHandler):
+    batcher = None
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_error(404)
+            return
+        stats = self.batcher.snapshot()
+        stats["mean_batch"] = stats.get("images", 0) / float(max(stats.get("batches", 0), 1))
+        self._reply(200, "application/json", json.dumps(stats).encode())
+
+    def do_POST(self):
+        if self.path != "/upscale":
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            with Image.open(io.BytesIO(body)) as image:
+                lr = np.asarray(image.convert('RGB'), dtype=np.uint8)
+        except Exception:
+            self.send_error(400, "Could not decode image")
+            return
+        try:
+            req = self.batcher.submit(lr)
+        except queue.Full:
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        req.done.wait()
+        if req.error is not None:
+            self.send_error(500, str(req.error))
+            return
+        out = io.BytesIO()
+        Image.fromarray(np.round(req.result).astype(np.uint8)).save(out, format='PNG')
+        self._reply(200, "image/png", out.getvalue())
+
+    def _reply(self, code, content_type, data):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def main():
+    config = tf.ConfigProto()
+    config.gpu_options.allow_growth = True
+    sess = tf.Session(config=config)
+    upscaler = load_upscaler(sess)
+    sess.graph.finalize()
+    # Warm up so the first request does not pay for kernel selection.
+    upscaler.run(np.zeros((1, cfg.LR_HEIGHT, cfg.LR_WIDTH, cfg.NUM_CHANNELS), np.float32))
+
+    Handler.batcher = MicroBatcher(upscaler)
+    server = Server((cfg.SERVE_HOST, cfg.SERVE_PORT), Handler)
+    logging.info("Serving on http://%s:%d (max batch %d, max wait %.1f ms, queue %d)",
+            cfg.SERVE_HOST, cfg.SERVE_PORT, cfg.SERVE_MAX_BATCH,
+            1000. * cfg.SERVE_MAX_WAIT, cfg.SERVE_QUEUE)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        Handler.batcher.close()
+        sess.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str)
+    parser.add_argument('--frozen', type=str)
+    parser.add_argument('--quantized', type=str)
+    parser.add_argument('--host', type=str)
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--max-batch', type=int)
+    parser.add_argument('--max-wait-ms', type=float)
+    parser.add_argument('--queue', type=int)
+    parser.add_argument('--tile', action="store_true")
+    parser.add_argument('--adaptive-threshold', type=float)
+    args = parser.parse_args()
+    if args.weights:
+        cfg.WEIGHTS = args.weights
+    if args.frozen:
+        cfg.FROZEN = args.frozen
+    if args.quantized:
+        cfg.QUANTIZED = args.quantized
+    if args.host:
+        cfg.SERVE_HOST = args.host
+    if args.port:
+        cfg.SERVE_PORT = args.port
+    if args.max_batch:
+        cfg.SERVE_MAX_BATCH = args.max_batch
+    if args.max_wait_ms is not None:
+        cfg.SERVE_MAX_WAIT = args.max_wait_ms / 1000.
+    if args.queue:
+        cfg.SERVE_QUEUE = args.queue
+    if args.tile:
+        cfg.TILE_PREDICT = True
+    if args.adaptive_threshold is not None:
+        cfg.ADAPTIVE_THRESHOLD = args.adaptive_threshold
+    main()
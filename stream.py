@@ -0,0 +1,180 @@
+import glob
+import io
+import logging
+import os
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+from PIL import Image
+from scipy.misc import imresize, toimage
+
+import config as cfg
+
+_DONE = object()
+
+
+def list_inputs(predict_dir=None, predict_list=None):
+    """Collects input paths from a directory and/or a file with one path per
+    line."""
+    paths = []
+    if predict_dir:
+        paths.extend(sorted(glob.glob(os.path.join(predict_dir, '*'))))
+    if predict_list:
+        with open(predict_list) as f:
+            paths.extend(line.strip() for line in f if line.strip())
+    return paths
+
+
+def load_image(path):
+    """Decodes `path` (a file name or file object) and returns (hr, lr) the same way SuperRes.predict does.
+    With STREAM_DOWNSCALE off the input is taken as the LR image and hr is
+    None."""
+    with Image.open(path) as image:
+        img = np.asarray(image.convert('RGB'), dtype=np.uint8)
+    if not cfg.STREAM_DOWNSCALE:
+        return None, img
+    w = img.shape[0] - img.shape[0] % cfg.r
+    h = img.shape[1] - img.shape[1] % cfg.r
+    hr = img[:w,:h]
+    return hr, imresize(hr, 100 // cfg.r, interp='bicubic')
+
+
+def save_outputs(output_name, sr, lr=None, hr=None, comparisons=False):
+    toimage(sr, cmin=0., cmax=255.).save(output_name + '_sr.JPEG')
+    if comparisons:
+        toimage(lr, cmin=0., cmax=255.).save(output_name + '_lr.JPEG')
+        bicubic = imresize(lr, cfg.r * 100, interp='bicubic')
+        toimage(bicubic, cmin=0., cmax=255.).save(output_name + '_bc.JPEG')
+        if hr is not None:
+            toimage(hr, cmin=0., cmax=255.).save(output_name + '_hr.JPEG')
+
+
+def _start_workers(fn, in_q, out_q, num_threads):
+    """Starts `num_threads` daemon threads applying `fn` to items of `in_q`.
+    Each worker forwards one _DONE to `out_q` when it sees _DONE."""
+    def work():
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                if out_q is not None:
+                    out_q.put(_DONE)
+                return
+            try:
+                res = fn(item)
+            except Exception:
+                logging.exception("Failed on %s", item[0] if isinstance(item, tuple) else item)
+                continue
+            if out_q is not None:
+                out_q.put(res)
+    threads = [threading.Thread(target=work) for _ in range(num_threads)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    return threads
+
+
+def predict_stream(upscaler, paths, output_dir, batch_size=None, comparisons=None, cache=None):
+    """Streams `paths` through a reader -> generator -> writer pipeline.
+
+    JPEG decode and encode run on DECODE_THREADS / ENCODE_THREADS threads with
+    bounded queues in between, so they overlap the TensorFlow compute without
+    holding more than PREFETCH decoded images in memory. Inputs with the same
+    LR shape are grouped into batches of up to `batch_size`; with tiling on,
+    each image goes through the tiled path on its own.
+
+    With a cache.ResultCache, inputs whose SR output is cached are copied to
+    `output_dir` by the reader threads and never decoded. The cache is not
+    used when comparison images are saved.
+    """
+    batch_size = batch_size or cfg.PREDICT_BATCH
+    comparisons = cfg.SAVE_COMPARISONS if comparisons is None else comparisons
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    path_q = queue.Queue()
+    decoded_q = queue.Queue(maxsize=cfg.PREFETCH)
+    encode_q = queue.Queue(maxsize=cfg.PREFETCH)
+    for path in paths:
+        path_q.put(path)
+    for _ in range(cfg.DECODE_THREADS):
+        path_q.put(_DONE)
+
+    if comparisons:
+        cache = None
+
+    def output_name(path):
+        return os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+
+    def decode(path):
+        if cache is None:
+            hr, lr = load_image(path)
+            return path, hr, lr, None
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = cache.key(data)
+        cached = cache.get(key)
+        if cached is not None:
+            with open(output_name(path) + '_sr.JPEG', 'wb') as f:
+                f.write(cached)
+            return None
+        hr, lr = load_image(io.BytesIO(data))
+        return path, hr, lr, key
+
+    def encode(item):
+        path, hr, lr, key, sr = item
+        save_outputs(output_name(path), sr, lr, hr, comparisons)
+        if key is not None:
+            with open(output_name(path) + '_sr.JPEG', 'rb') as f:
+                cache.put(key, f.read())
+
+    _start_workers(decode, path_q, decoded_q, cfg.DECODE_THREADS)
+    writers = _start_workers(encode, encode_q, None, cfg.ENCODE_THREADS)
+
+    def flush(items):
+        if cfg.TILE_PREDICT or cfg.ADAPTIVE_THRESHOLD is not None:
+            srs = [upscaler.upscale(item[2]) for item in items]
+        else:
+            batch = np.stack([item[2] for item in items]).astype(np.float32)
+            srs = np.maximum(np.minimum(upscaler.run(batch), 255.0), 0.0)
+        for item, sr in zip(items, srs):
+            encode_q.put(item + (sr,))
+
+    start = time.time()
+    buckets = {}
+    pending = 0
+    remaining = cfg.DECODE_THREADS
+    while remaining:
+        item = decoded_q.get()
+        if item is _DONE:
+            remaining -= 1
+            continue
+        if item is None:
+            continue
+        bucket = buckets.setdefault(item[2].shape, [])
+        bucket.append(item)
+        pending += 1
+        if len(bucket) >= batch_size:
+            flush(buckets.pop(item[2].shape))
+            pending -= len(bucket)
+        elif pending >= cfg.PREFETCH:
+            # Too many odd shapes waiting for company; run the largest group.
+            shape = max(buckets, key=lambda k: len(buckets[k]))
+            pending -= len(buckets[shape])
+            flush(buckets.pop(shape))
+    for shape in list(buckets):
+        flush(buckets.pop(shape))
+
+    for _ in writers:
+        encode_q.put(_DONE)
+    for t in writers:
+        t.join()
+    elapsed = time.time() - start
+    logging.info("Predicted %d images in %.1fs (%.2f images/sec)",
+            len(paths), elapsed, len(paths) / max(elapsed, 1e-6))
+    if cache is not None:
+        cache.log_stats()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+import config as cfg
+from inference import receptive_field
+from metrics import evaluate_batch
+from model import SuperRes, ssim
+
+
+class ConstantLoader(object):
+    """Loader stand-in serving one random batch."""
+    def __init__(self):
+        rng = np.random.RandomState(0)
+        hr = rng.randint(0, 256, (cfg.BATCH_SIZE, cfg.HR_HEIGHT, cfg.HR_WIDTH,
+                cfg.NUM_CHANNELS)).astype(np.uint8)
+        self.hr = tf.constant(hr)
+        self.lr = tf.image.resize_bicubic(self.hr, [cfg.LR_HEIGHT, cfg.LR_WIDTH])
+
+    def batch(self):
+        return ((self.lr, self.hr),) * 3
+
+
+class UpscalerGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.defaults = (cfg.NUM_RES_BLOCKS, cfg.GEN_CHANNELS, cfg.TILE_SIZE, cfg.TILE_OVERLAP)
+        cfg.NUM_RES_BLOCKS, cfg.GEN_CHANNELS = 2, 8
+        cfg.TILE_SIZE, cfg.TILE_OVERLAP = 24, 8
+        self.graph = tf.Graph()
+        self.graph_ctx = self.graph.as_default()
+        self.graph_ctx.__enter__()
+        self.sess = tf.Session(graph=self.graph)
+        self.model = SuperRes(self.sess, ConstantLoader())
+        self.sess.run([tf.initialize_all_variables(), tf.initialize_local_variables()])
+
+    def tearDown(self):
+        self.sess.close()
+        self.graph_ctx.__exit__(None, None, None)
+        (cfg.NUM_RES_BLOCKS, cfg.GEN_CHANNELS, cfg.TILE_SIZE, cfg.TILE_OVERLAP) = self.defaults
+
+    def test_predictions_do_not_grow_graph(self):
+        num_nodes = len(self.sess.graph.as_graph_def().node)
+        rng = np.random.RandomState(1)
+        for height, width in [(24, 24), (17, 31), (40, 64), (24, 24), (50, 33)]:
+            lr = rng.randint(0, 256, (height, width, cfg.NUM_CHANNELS)).astype(np.uint8)
+            for tiled in (False, True):
+                sr = self.model.upscaler.upscale(lr, tiled=tiled)
+                self.assertEqual(sr.shape, (height * cfg.r, width * cfg.r, cfg.NUM_CHANNELS))
+                self.assertEqual(len(self.sess.graph.as_graph_def().node), num_nodes)
+
+    def test_tiled_matches_full_image(self):
+        # Exact once every kept tile pixel has a full receptive field inside
+        # its tile; see tiled_upscale.
+        cfg.TILE_OVERLAP = 4 * receptive_field()
+        cfg.TILE_SIZE = cfg.TILE_OVERLAP + 12
+        rng = np.random.RandomState(2)
+        lr = rng.randint(0, 256, (cfg.TILE_SIZE + 30, 2 * cfg.TILE_SIZE + 7,
+                cfg.NUM_CHANNELS)).astype(np.uint8)
+        full = self.model.upscaler.upscale(lr, tiled=False)
+        tiled = self.model.upscaler.upscale(lr, tiled=True)
+        np.testing.assert_allclose(tiled, full, rtol=0, atol=1e-2)
+
+
+class SSIMTest(unittest.TestCase):
+    def test_evaluate_batch_matches_model_ssim(self):
+        rng = np.random.RandomState(0)
+        pred = rng.randint(0, 256, (6, 70, 90, cfg.NUM_CHANNELS)).astype(np.float64)
+        target = np.clip(pred + rng.randn(*pred.shape) * 20, 0, 255)
+        expected = np.array([ssim(p, t) for p, t in zip(pred, target)])
+        np.testing.assert_allclose(evaluate_batch(pred, target)['ssim'], expected,
+                rtol=0, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()